@@ -0,0 +1,116 @@
+import logging
+import queue
+import threading
+import time
+from metrics import REGISTRY, DB_OPERATION_DURATION, timed
+
+logger = logging.getLogger("SystemLogger")
+
+
+class BatchWriter:
+    """Single writer thread that applies queued SQL mutations in batched transactions."""
+
+    STOP = object()
+
+    def __init__(self, db, max_batch=500, max_delay=0.005):
+        """
+        Args:
+            db (SQLitePool): Connection pool of the database to write to.
+            max_batch (int): Maximum number of queued entries committed in one transaction.
+            max_delay (float): Seconds to wait for more entries once a batch has started.
+        """
+        self.db = db
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self.queue = queue.Queue()
+        REGISTRY.gauge("batch_writer_queue_depth", "Statements waiting for the batch writer",
+                       callback=lambda: {(): self.queue.qsize()})
+        self.batch_size = REGISTRY.histogram("batch_writer_batch_size", "Entries committed per batch",
+                                             buckets=(1, 5, 10, 50, 100, 250, 500, 1000))
+        self.thread = threading.Thread(target=self.run, name="BatchWriter", daemon=True)
+        self.thread.start()
+
+    def submit(self, sql, params=(), callback=None, errback=None):
+        """
+        Queue a statement; callback is called without arguments once it is committed.
+        If the statement fails, errback is called with the exception instead (callback if
+        there is no errback).
+        """
+        self.queue.put((sql, params, callback, errback, False))
+
+    def submit_many(self, sql, seq_of_params, callback=None, errback=None):
+        """
+        Queue a statement executed once per parameter tuple; callback is called once all are
+        committed. The rows are committed together or not at all; if they fail, errback is
+        called with the exception instead (callback if there is no errback).
+        """
+        self.queue.put((sql, list(seq_of_params), callback, errback, True))
+
+    def call(self, callback):
+        """Queue a callback that runs after every previously submitted statement is committed."""
+        self.queue.put((None, None, callback, None, False))
+
+    def stop(self):
+        """Commit everything still queued and stop the writer thread."""
+        self.queue.put(self.STOP)
+        self.thread.join()
+
+    def run(self):
+        # Collect entries until the batch is full or max_delay has passed, then commit them.
+        while True:
+            entry = self.queue.get()
+            if entry is self.STOP:
+                return
+            batch = [entry]
+            stopping = False
+            deadline = time.monotonic() + self.max_delay
+            while len(batch) < self.max_batch:
+                try:
+                    entry = self.queue.get(timeout=max(deadline - time.monotonic(), 0))
+                except queue.Empty:
+                    break
+                if entry is self.STOP:
+                    stopping = True
+                    break
+                batch.append(entry)
+            self.commit(batch)
+            if stopping:
+                return
+
+    def commit(self, batch):
+        # Apply the batch in one transaction. If it fails, apply the entries one by one,
+        # each in a transaction of its own, so a single bad entry does not discard the others.
+        errors = {}
+        self.batch_size.observe(len(batch))
+        try:
+            with timed(DB_OPERATION_DURATION, "batch_commit"), self.db.connect() as conn:
+                for entry in batch:
+                    self.execute(conn, entry)
+        except Exception as e:
+            logger.error(f"Batch write of {len(batch)} entries failed, retrying one by one: {e}")
+            for index, entry in enumerate(batch):
+                try:
+                    with self.db.connect() as conn:
+                        self.execute(conn, entry)
+                except Exception as e:
+                    logger.error(f"Write failed: {entry[0].strip()}: {e}")
+                    errors[index] = e
+        for index, (_, _, callback, errback, _) in enumerate(batch):
+            try:
+                if index in errors and errback is not None:
+                    errback(errors[index])
+                elif callback is not None:
+                    callback()
+            except Exception as e:
+                logger.error(f"Batch writer callback failed: {e}")
+
+    @staticmethod
+    def execute(conn, entry):
+        # Run the statement of a queued entry on conn; callback-only entries have none.
+        sql, params, _, _, many = entry
+        if sql is None:
+            return
+        if many:
+            conn.executemany(sql, params)
+        else:
+            conn.execute(sql, params)
@@ -0,0 +1,298 @@
+"""
+Benchmark of task dispatch and the task API on the local machine.
+
+Starts item_server.py as the sink and main.py (plus optional --worker processes)
+as subprocesses in a scratch directory, seeds synthetic tasks that POST to the
+sink, and measures:
+- dispatch lag: how late each execution started compared to its scheduled time
+- executions per second
+- API latency percentiles under concurrent requests
+
+Results are written as JSON so runs can be compared, e.g.
+    python benchmark.py --tasks 5000 --duration 20 --output before.json
+"""
+import argparse
+import json
+import math
+import os
+import platform
+import random
+import socket
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+import requests
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+# Percentiles reported for every latency distribution
+PERCENTILES = (50, 90, 99)
+# Tasks per POST /tasks/batch request while seeding
+SEED_BATCH_SIZE = 1000
+# Seconds to wait for a started server to accept connections
+STARTUP_TIMEOUT = 30
+
+
+def percentiles(values):
+    """Nearest-rank percentiles, min, avg and max of a list of numbers, rounded to 0.01."""
+    if not values:
+        return {"count": 0}
+    values = sorted(values)
+    result = {"count": len(values), "min": round(values[0], 2),
+              "avg": round(sum(values) / len(values), 2), "max": round(values[-1], 2)}
+    for p in PERCENTILES:
+        result[f"p{p}"] = round(values[max(math.ceil(p / 100 * len(values)), 1) - 1], 2)
+    return result
+
+
+def wait_for_port(port, process):
+    """Block until something accepts connections on localhost:port."""
+    deadline = time.monotonic() + STARTUP_TIMEOUT
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"{process.args} exited with {process.returncode}")
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=1).close()
+            return
+        except OSError:
+            time.sleep(0.05)
+    raise RuntimeError(f"Nothing listening on port {port} after {STARTUP_TIMEOUT}s")
+
+
+def start(script, args, workdir, log_name):
+    """Start a TaskBot script as a subprocess in workdir with its output in log_name."""
+    log = open(os.path.join(workdir, log_name), "w")
+    return subprocess.Popen([sys.executable, os.path.join(HERE, script), *args],
+                            cwd=workdir, stdout=log, stderr=subprocess.STDOUT)
+
+
+def stop(process):
+    """Stop a subprocess with SIGTERM so it drains and flushes its writes."""
+    if process.poll() is None:
+        process.terminate()
+        try:
+            process.wait(30)
+        except subprocess.TimeoutExpired:
+            process.kill()
+            process.wait()
+
+
+def synthetic_tasks(options, rng, first_execution):
+    """Task objects that POST to the sink, due within --spread seconds of first_execution."""
+    destination = f"http://127.0.0.1:{options.sink_port}/items"
+    tasks = {}
+    for index in range(options.tasks):
+        task_type = "single" if rng.random() < options.single_ratio else "interval"
+        next_execution = first_execution + timedelta(seconds=rng.uniform(0, options.spread))
+        tasks[f"bench-{index}"] = {
+            "name": f"bench-{index}",
+            "operation": "POST",
+            "type": task_type,
+            "interval": options.interval,
+            "next_execution": next_execution.isoformat(),
+            "destination": destination,
+            "payload": json.dumps({"payload": f"bench-{index}"}),
+        }
+    return tasks
+
+
+def seed(session, base_url, tasks):
+    """Create the tasks through POST /tasks/batch and return the seconds it took."""
+    start_time = time.perf_counter()
+    items = list(tasks.values())
+    for offset in range(0, len(items), SEED_BATCH_SIZE):
+        response = session.post(f"{base_url}/tasks/batch", json=items[offset:offset + SEED_BATCH_SIZE])
+        response.raise_for_status()
+        failed = {status: count for status, count in response.json()["summary"].items() if status != "201"}
+        if failed:
+            raise RuntimeError(f"Seeding failed: {failed}")
+    return time.perf_counter() - start_time
+
+
+def api_load(base_url, names, concurrency, until):
+    """
+    Send API requests from concurrency threads until the monotonic time until.
+    Each thread cycles through GET /tasks?name=, GET /tasks?limit=100 and GET /stats.
+    Returns the latencies in milliseconds per endpoint and the number of errors.
+    """
+    latencies = {"get_task": [], "list_page": [], "stats": []}
+    errors = []
+    lock = threading.Lock()
+
+    def client(seed_value):
+        rng = random.Random(seed_value)
+        session = requests.Session()
+        requests_by_endpoint = [
+            ("get_task", lambda: f"{base_url}/tasks?name={rng.choice(names)}"),
+            ("list_page", lambda: f"{base_url}/tasks?limit=100&fields=id,name,next_execution"),
+            ("stats", lambda: f"{base_url}/stats"),
+        ]
+        local = {endpoint: [] for endpoint in latencies}
+        local_errors = 0
+        index = 0
+        while time.monotonic() < until:
+            endpoint, url = requests_by_endpoint[index % len(requests_by_endpoint)]
+            index += 1
+            start_time = time.perf_counter()
+            try:
+                response = session.get(url())
+                elapsed = (time.perf_counter() - start_time) * 1000
+                if response.status_code >= 500:
+                    local_errors += 1
+                else:
+                    local[endpoint].append(elapsed)
+            except requests.RequestException:
+                local_errors += 1
+        session.close()
+        with lock:
+            for endpoint, values in local.items():
+                latencies[endpoint].extend(values)
+            errors.append(local_errors)
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        for index in range(concurrency):
+            executor.submit(client, index)
+    return latencies, sum(errors)
+
+
+def execution_results(database, task_ids, tasks, interval, window_start, window_end):
+    """
+    Dispatch lag and throughput from the executions table of the stopped scheduler.
+    The first execution of a task is due at its seeded next_execution; every following one
+    is due interval seconds after the previous execution finished, as the scheduler sets it.
+    """
+    conn = sqlite3.connect(database)
+    rows = conn.execute("""
+    SELECT task_id, started_at, duration_ms, success FROM executions
+    WHERE started_at >= ? AND started_at < ?
+    ORDER BY task_id, started_at
+    """, (window_start, window_end)).fetchall()
+    conn.close()
+    lags = []
+    durations = []
+    successes = 0
+    previous = {}
+    for task_id, started_at, duration_ms, success in rows:
+        durations.append(duration_ms)
+        successes += success
+        if task_id in previous:
+            prev_started, prev_duration = previous[task_id]
+            due = prev_started + prev_duration + interval * 1000
+        else:
+            due = int(datetime.fromisoformat(tasks[task_ids[task_id]]["next_execution"]).timestamp() * 1000)
+        lags.append(max(started_at - due, 0))
+        previous[task_id] = (started_at, duration_ms)
+    seconds = (window_end - window_start) / 1000
+    return {
+        "executions": len(rows),
+        "successful": successes,
+        "executions_per_second": round(len(rows) / seconds, 2),
+        "dispatch_lag_ms": percentiles(lags),
+        "request_duration_ms": percentiles(durations),
+    }
+
+
+def environment():
+    """Versions and revision the results were measured with."""
+    try:
+        revision = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=HERE, capture_output=True,
+                                  text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        revision = None
+    return {
+        "revision": revision,
+        "python": platform.python_version(),
+        "sqlite": sqlite3.sqlite_version,
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+    }
+
+
+def run(options):
+    rng = random.Random(options.seed)
+    workdir = options.workdir or tempfile.mkdtemp(prefix="taskbot-bench-")
+    os.makedirs(workdir, exist_ok=True)
+    base_url = f"http://127.0.0.1:{options.api_port}"
+    processes = []
+    try:
+        sink = start("item_server.py", ["--port", str(options.sink_port)], workdir, "item_server.log")
+        processes.append(sink)
+        wait_for_port(options.sink_port, sink)
+        api = start("main.py", ["--port", str(options.api_port)], workdir, "main.log")
+        processes.append(api)
+        wait_for_port(options.api_port, api)
+        for index in range(options.workers):
+            processes.append(start("main.py", ["--worker"], workdir, f"worker-{index}.log"))
+
+        session = requests.Session()
+        first_execution = datetime.now() + timedelta(seconds=options.warmup)
+        tasks = synthetic_tasks(options, rng, first_execution)
+        seed_seconds = seed(session, base_url, tasks)
+        ids = session.get(f"{base_url}/tasks", params={"fields": "id,name"}).json()
+        task_ids = {task["id"]: task["name"] for task in ids}
+
+        window_start = int(first_execution.timestamp() * 1000)
+        time.sleep(max(first_execution.timestamp() - time.time(), 0))
+        until = time.monotonic() + options.duration
+        if options.concurrency:
+            latencies, api_errors = api_load(base_url, list(tasks), options.concurrency, until)
+        else:
+            latencies, api_errors = {}, 0
+        time.sleep(max(until - time.monotonic(), 0))
+        window_end = int(time.time() * 1000)
+    finally:
+        # Stopping the schedulers commits their queued executions
+        for process in reversed(processes):
+            stop(process)
+
+    all_latencies = [value for values in latencies.values() for value in values]
+    return {
+        "config": {name: value for name, value in vars(options).items() if name not in ("output", "workdir")},
+        "environment": environment(),
+        "seed_seconds": round(seed_seconds, 3),
+        "scheduler": execution_results(os.path.join(workdir, "tasks.db"), task_ids, tasks, options.interval,
+                                       window_start, window_end),
+        "api": {
+            "concurrency": options.concurrency,
+            "requests": len(all_latencies),
+            "errors": api_errors,
+            "requests_per_second": round(len(all_latencies) / options.duration, 2),
+            "latency_ms": percentiles(all_latencies),
+            "endpoints": {endpoint: percentiles(values) for endpoint, values in latencies.items()},
+        },
+        "workdir": workdir,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark TaskBot dispatch and API latency against a local sink")
+    parser.add_argument("--tasks", type=int, default=2000, help="number of synthetic tasks")
+    parser.add_argument("--single-ratio", type=float, default=0.2, help="fraction of single-run tasks")
+    parser.add_argument("--interval", type=int, default=5, help="interval of repeating tasks (seconds)")
+    parser.add_argument("--spread", type=float, default=5, help="first executions are spread over this many seconds")
+    parser.add_argument("--warmup", type=float, default=2, help="seconds between seeding and the first execution")
+    parser.add_argument("--duration", type=float, default=15, help="measured seconds")
+    parser.add_argument("--concurrency", type=int, default=8, help="parallel API clients (0 to skip API load)")
+    parser.add_argument("--workers", type=int, default=0, help="additional main.py --worker processes")
+    parser.add_argument("--seed", type=int, default=1, help="random seed of the task mix")
+    parser.add_argument("--api-port", type=int, default=18000)
+    parser.add_argument("--sink-port", type=int, default=18001)
+    parser.add_argument("--workdir", help="directory for the databases and logs (default: new temporary directory)")
+    parser.add_argument("--output", help="write the JSON results to this file instead of stdout")
+    options = parser.parse_args()
+
+    results = run(options)
+    output = json.dumps(results, indent=2)
+    if options.output:
+        with open(options.output, "w") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
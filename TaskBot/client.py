@@ -1,10 +1,29 @@
 import requests
 import json
 import os
+import sys
 import time
+import argparse
+import fnmatch
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
 
 clear = lambda: os.system('cls')
 
+# Bulk mode: tasks sent per POST /tasks/batch and batches sent at the same time
+BULK_BATCH_SIZE = 500
+BULK_PARALLELISM = 4
+# Fields of a task that apply compares and export writes; the other fields are managed by the server
+SPEC_FIELDS = ("name", "operation", "type", "interval", "cron", "next_execution", "destination", "payload",
+               "misfire_policy", "jitter", "rate_limit", "retry_policy")
+# Values the server stores for fields a task definition leaves out (interval depends on the type)
+SPEC_DEFAULTS = {"cron": None, "payload": None, "misfire_policy": "coalesce", "jitter": 0,
+                 "rate_limit": None, "retry_policy": None}
+# Failed items listed in the bulk summary
+MAX_LISTED_FAILURES = 20
+
+session = requests.Session()
+
 def make_request(url, method='GET', params=None, data=None, headers=None, echo=0):
     if headers is None:
         headers = {'Content-Type': 'application/json'}
@@ -13,7 +32,7 @@ def make_request(url, method='GET', params=None, data=None, headers=None, echo=0
         data = json.dumps(data)
 
     try:
-        response = requests.request(method, url, params=params, data=data, headers=headers)
+        response = session.request(method, url, params=params, data=data, headers=headers)
         if(echo):
             print(f"Request: {method} {url}")
         if params:
@@ -31,6 +50,183 @@ def make_request(url, method='GET', params=None, data=None, headers=None, echo=0
         print(f"Error during request: {e}")
 
 
+def open_session(parallelism):
+    # Session keeping one keep-alive connection per parallel request.
+    bulk_session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=parallelism)
+    bulk_session.mount("http://", adapter)
+    bulk_session.mount("https://", adapter)
+    return bulk_session
+
+def fetch_all_tasks(bulk_session, url):
+    # Current tasks by name, read with a single streamed GET /tasks.
+    response = bulk_session.get(f"{url}/tasks")
+    response.raise_for_status()
+    return {task["name"]: task for task in response.json()}
+
+def read_task_file(path):
+    # Task definitions of a JSON array or NDJSON file ("-" = stdin).
+    if path == "-":
+        content = sys.stdin.read()
+    else:
+        with open(path, encoding="utf-8") as file:
+            content = file.read()
+    if content.lstrip().startswith("["):
+        return json.loads(content)
+    return [json.loads(line) for line in content.splitlines() if line.strip()]
+
+def spec_value(task, field):
+    # Value of a field as the server stores it, so definitions compare equal to what they produced.
+    if field == "interval" and task.get("interval") is None and task.get("type") != "cron":
+        return 600
+    value = task.get(field, SPEC_DEFAULTS.get(field))
+    if field == "cron" and isinstance(value, str):
+        value = " ".join(value.split()).lower()
+    return value
+
+def task_changed(desired, current):
+    # Whether applying a definition would change the task. next_execution moves on with every
+    # run; in a definition it is the first run of a new task and is not compared.
+    return any(spec_value(desired, field) != spec_value(current, field)
+               for field in SPEC_FIELDS if field != "next_execution")
+
+def plan_apply(desired_tasks, current, prune):
+    # Batch items that bring the server to the desired tasks, and the number of unchanged ones.
+    items = []
+    unchanged = 0
+    names = set()
+    for task in desired_tasks:
+        name = task.get("name")
+        if not name:
+            raise ValueError(f"Task without a name: {task}")
+        if name in names:
+            raise ValueError(f"Task defined twice: {name}")
+        names.add(name)
+        existing = current.get(name)
+        if existing is None:
+            items.append({**task, "op": "create"})
+        elif task_changed(task, existing):
+            # A changed task keeps its schedule
+            items.append({**task, "next_execution": existing["next_execution"], "op": "upsert"})
+        else:
+            unchanged += 1
+    if prune:
+        items += [{"name": name, "op": "delete"} for name in current if name not in names]
+    return items, unchanged
+
+def send_batches(bulk_session, url, items, batch_size, parallelism):
+    # Send the items in batches over parallel requests. Returns the results in item order.
+    def send(batch):
+        body = "\n".join(json.dumps(item) for item in batch)
+        try:
+            response = bulk_session.post(f"{url}/tasks/batch", data=body,
+                                         headers={"Content-Type": "application/x-ndjson"})
+            if response.status_code == 200:
+                return response.json()["results"]
+            error = f"HTTP {response.status_code}: {response.text[:200]}"
+        except requests.RequestException as e:
+            error = str(e)
+        return [{"name": item.get("name"), "status": None, "error": error} for item in batch]
+
+    batches = [items[start:start + batch_size] for start in range(0, len(items), batch_size)]
+    with ThreadPoolExecutor(max_workers=parallelism) as executor:
+        return [result for results in executor.map(send, batches) for result in results]
+
+def report(action, results, elapsed, unchanged=None):
+    # Print counts per status, throughput and the failed items.
+    summary = {}
+    failures = []
+    for result in results:
+        status = result["status"]
+        summary[status] = summary.get(status, 0) + 1
+        if status is None or status >= 400:
+            failures.append(result)
+    rate = len(results) / elapsed if elapsed > 0 else 0
+    counts = ", ".join(f"{status or 'failed'}: {count}" for status, count in sorted(summary.items(), key=str))
+    print(f"{action}: {len(results)} tasks in {elapsed:.2f}s ({rate:.0f}/s){' - ' + counts if counts else ''}")
+    if unchanged is not None:
+        print(f"Unchanged: {unchanged}")
+    for result in failures[:MAX_LISTED_FAILURES]:
+        print(f"  {result['name']}: {result['status'] or 'failed'} {result.get('error', '')}")
+    if len(failures) > MAX_LISTED_FAILURES:
+        print(f"  ... and {len(failures) - MAX_LISTED_FAILURES} more failures")
+    return 1 if failures else 0
+
+def bulk_apply(options):
+    # Create and update the tasks of a file, and with --prune delete the tasks missing from it.
+    bulk_session = open_session(options.parallel)
+    desired_tasks = read_task_file(options.file)
+    current = fetch_all_tasks(bulk_session, options.url)
+    items, unchanged = plan_apply(desired_tasks, current, options.prune)
+    if options.dry_run:
+        for item in items:
+            print(f"{item['op']} {item['name']}")
+        print(f"{len(items)} changes, {unchanged} unchanged")
+        return 0
+    started = time.monotonic()
+    results = send_batches(bulk_session, options.url, items, options.batch_size, options.parallel)
+    return report("Applied", results, time.monotonic() - started, unchanged)
+
+def bulk_export(options):
+    # Write all task definitions as NDJSON, in a form apply accepts.
+    bulk_session = open_session(1)
+    current = fetch_all_tasks(bulk_session, options.url)
+    output = sys.stdout if options.file == "-" else open(options.file, "w", encoding="utf-8")
+    try:
+        for task in current.values():
+            definition = {field: task[field] for field in SPEC_FIELDS if task.get(field) is not None}
+            output.write(json.dumps(definition) + "\n")
+    finally:
+        if output is not sys.stdout:
+            output.close()
+    print(f"Exported {len(current)} tasks", file=sys.stderr)
+    return 0
+
+def bulk_delete(options):
+    # Delete the tasks whose names match any of the glob patterns.
+    bulk_session = open_session(options.parallel)
+    current = fetch_all_tasks(bulk_session, options.url)
+    names = [name for name in current if any(fnmatch.fnmatchcase(name, pattern) for pattern in options.patterns)]
+    if options.dry_run:
+        for name in names:
+            print(f"delete {name}")
+        print(f"{len(names)} tasks match")
+        return 0
+    started = time.monotonic()
+    items = [{"name": name, "op": "delete"} for name in names]
+    results = send_batches(bulk_session, options.url, items, options.batch_size, options.parallel)
+    return report("Deleted", results, time.monotonic() - started)
+
+def bulk_main(argv):
+    # Non-interactive mode: client.py apply|export|delete ...
+    parser = argparse.ArgumentParser(prog="client.py", description="Manage tasks in bulk")
+    parser.add_argument("--url", default="http://localhost:8000", help="base URL of the task server")
+    parser.add_argument("--batch-size", type=int, default=BULK_BATCH_SIZE, help="tasks per batch request")
+    parser.add_argument("--parallel", type=int, default=BULK_PARALLELISM, help="batch requests sent at the same time")
+    commands = parser.add_subparsers(dest="command", required=True)
+    apply_parser = commands.add_parser("apply", help="create and update tasks from a JSON or NDJSON file")
+    apply_parser.add_argument("file", help="task definitions, - for stdin")
+    apply_parser.add_argument("--prune", action="store_true", help="also delete tasks that are not in the file")
+    apply_parser.add_argument("--dry-run", action="store_true", help="only print the changes")
+    export_parser = commands.add_parser("export", help="write all tasks as NDJSON")
+    export_parser.add_argument("file", nargs="?", default="-", help="output file, - for stdout")
+    delete_parser = commands.add_parser("delete", help="delete the tasks matching name patterns")
+    delete_parser.add_argument("patterns", nargs="+", help="glob patterns, e.g. 'report-*'")
+    delete_parser.add_argument("--dry-run", action="store_true", help="only print the matching tasks")
+    options = parser.parse_args(argv)
+    if options.batch_size < 1 or options.parallel < 1:
+        parser.error("--batch-size and --parallel must be at least 1")
+    options.url = options.url.rstrip("/")
+    try:
+        return {"apply": bulk_apply, "export": bulk_export, "delete": bulk_delete}[options.command](options)
+    except (OSError, ValueError, requests.RequestException) as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 1
+
+
+if len(sys.argv) > 1:
+    sys.exit(bulk_main(sys.argv[1:]))
+
 base_url = 'http://localhost:8000/tasks'
 
 
@@ -68,13 +264,20 @@ if(task_number == "0"):
         else:
             print("Invalid operation. Please enter get, post, put or delete.")
     while True:
-        create_type = input("input type (single/interval): ")
-        if create_type in {"single", "interval"}:
+        create_type = input("input type (single/interval/cron): ")
+        if create_type in {"single", "interval", "cron"}:
             create_task["type"] = create_type
             break
         else:
-            print("Invalid type. Please enter single or interval.")
-    while True:
+            print("Invalid type. Please enter single, interval or cron.")
+    while create_type == "cron":
+        create_cron = input("input cron expression (minute hour day month weekday): ")
+        if create_cron:
+            create_task["cron"] = create_cron
+            break
+        else:
+            print("Invalid cron expression. Please enter an expression that is not empty.")
+    while create_type != "cron":
         create_interval = input("input interval (seconds): ")
         if create_interval and int(create_interval) > 0:
             create_task["interval"] = int(create_interval)
@@ -0,0 +1,161 @@
+import calendar
+from datetime import datetime, timedelta
+from functools import lru_cache
+
+# Five-field expressions: minute hour day-of-month month day-of-week
+FIELD_RANGES = ((0, 59), (0, 23), (1, 31), (1, 12), (0, 7))
+MONTH_NAMES = {name.lower(): number for number, name in enumerate(calendar.month_abbr) if name}
+DAY_NAMES = {"sun": 0, "mon": 1, "tue": 2, "wed": 3, "thu": 4, "fri": 5, "sat": 6}
+MACROS = {
+    "@yearly": "0 0 1 1 *",
+    "@annually": "0 0 1 1 *",
+    "@monthly": "0 0 1 * *",
+    "@weekly": "0 0 * * 0",
+    "@daily": "0 0 * * *",
+    "@midnight": "0 0 * * *",
+    "@hourly": "0 * * * *",
+}
+# Compiled schedules kept for reuse by tasks with the same expression
+CACHE_SIZE = 4096
+# Months searched for a matching day before an expression is considered to never fire
+# (Feb 29 on a given weekday can take 28 years)
+MAX_MONTHS = 12 * 30
+
+
+def next_bit(mask, start):
+    """Position of the lowest set bit of mask at or above start, or None."""
+    rest = mask >> start
+    if not rest:
+        return None
+    return start + (rest & -rest).bit_length() - 1
+
+
+def parse_field(text, index):
+    """Bitset of the values a comma separated cron field matches."""
+    low, high = FIELD_RANGES[index]
+    names = MONTH_NAMES if index == 3 else DAY_NAMES if index == 4 else {}
+
+    def value(token):
+        token = token.lower()
+        number = names[token] if token in names else int(token)
+        if not low <= number <= high:
+            raise ValueError(f"{number} is out of range {low}-{high}")
+        return number
+
+    mask = 0
+    for part in text.split(","):
+        if "/" in part:
+            part, step = part.split("/", 1)
+            step = int(step)
+            if step < 1:
+                raise ValueError(f"Invalid step: {step}")
+        else:
+            step = 1
+        if part == "*":
+            start, end = low, high
+        elif "-" in part:
+            start, end = (value(token) for token in part.split("-", 1))
+            if start > end:
+                raise ValueError(f"Invalid range: {part}")
+        else:
+            start = value(part)
+            # "5/15" means from 5 to the end of the range
+            end = high if step > 1 else start
+        for number in range(start, end + 1, step):
+            mask |= 1 << number
+    return mask
+
+
+class CronSchedule:
+    """
+    A compiled cron expression. Every field is a bitset of the values it matches, so the
+    next fire time is found with a few bit operations per month instead of stepping through
+    the minutes. Instances are shared and immutable; use compile_cron() to get one.
+    """
+
+    def __init__(self, expression):
+        fields = MACROS.get(expression, expression).split()
+        if len(fields) != 5:
+            raise ValueError(f"Cron expression needs 5 fields: {expression!r}")
+        try:
+            self.minutes, self.hours, days, self.months, weekdays = (
+                parse_field(field, index) for index, field in enumerate(fields))
+        except (KeyError, ValueError) as e:
+            raise ValueError(f"Invalid cron expression {expression!r}: {e}") from None
+        self.expression = expression
+        # Sunday can be written as 0 or 7
+        if weekdays & 1 << 7:
+            weekdays = (weekdays | 1) & ~(1 << 7)
+        # As in cron, a day matches either field if both are restricted, otherwise the restricted one
+        days_restricted = not fields[2].startswith("*")
+        weekdays_restricted = not fields[4].startswith("*")
+        if days_restricted and weekdays_restricted:
+            self.days, self.weekdays = days, weekdays
+        elif weekdays_restricted:
+            self.days, self.weekdays = 0, weekdays
+        else:
+            self.days, self.weekdays = days, 0
+        # Days of a month matched by the weekdays, for each weekday the month can start on
+        self.weekday_days = []
+        for first_weekday in range(7):
+            mask = 0
+            for day in range(1, 32):
+                if self.weekdays >> ((first_weekday + day - 1) % 7) & 1:
+                    mask |= 1 << day
+            self.weekday_days.append(mask)
+        self.last = (None, None)
+        if self.next_after(datetime(2000, 1, 1)) is None:
+            raise ValueError(f"Cron expression never fires: {expression!r}")
+
+    def month_days(self, year, month):
+        """Bitset of the days of a month the schedule fires on."""
+        first_weekday, length = calendar.monthrange(year, month)
+        # calendar counts weekdays from Monday, cron from Sunday
+        days = self.days | self.weekday_days[(first_weekday + 1) % 7]
+        return days & ((1 << (length + 1)) - 2)
+
+    def next_after(self, moment):
+        """First fire time strictly after moment (naive local datetime), or None if there is none."""
+        start = moment.replace(second=0, microsecond=0) + timedelta(minutes=1)
+        # Tasks sharing the expression mostly ask for the same minute
+        key, result = self.last
+        if key == start:
+            return result
+        year, month, day, hour, minute = start.year, start.month, start.day, start.hour, start.minute
+        result = None
+        for _ in range(MAX_MONTHS):
+            if self.months >> month & 1:
+                days = self.month_days(year, month)
+                found = next_bit(days, day)
+                while found is not None:
+                    if found != day:
+                        hour = minute = 0
+                    found_hour = next_bit(self.hours, hour)
+                    if found_hour is not None:
+                        found_minute = next_bit(self.minutes, minute if found_hour == hour else 0)
+                        if found_minute is None:
+                            found_hour = next_bit(self.hours, found_hour + 1)
+                            found_minute = next_bit(self.minutes, 0)
+                        if found_hour is not None:
+                            result = datetime(year, month, found, found_hour, found_minute)
+                            break
+                    day, hour, minute = found + 1, 0, 0
+                    found = next_bit(days, day)
+                if result is not None:
+                    break
+            month, day, hour, minute = month + 1, 1, 0, 0
+            if month > 12:
+                year, month = year + 1, 1
+        self.last = (start, result)
+        return result
+
+
+def normalize(expression):
+    """Expression with single spaces and lower case names, the form schedules are cached by."""
+    return " ".join(expression.split()).lower()
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def compile_cron(expression):
+    """Shared CronSchedule of a normalized expression; raises ValueError if it is invalid."""
+    return CronSchedule(expression)
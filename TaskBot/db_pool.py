@@ -0,0 +1,62 @@
+import sqlite3
+import threading
+
+
+def storable(value):
+    """Whether SQLite can store a JSON value as given: a string, a float, null or a 64-bit integer."""
+    if isinstance(value, int):
+        return -2 ** 63 <= value < 2 ** 63
+    return value is None or isinstance(value, (str, float))
+
+
+class SQLitePool:
+    """Per-thread SQLite connections in WAL mode, shared by the API handlers and the scheduler."""
+
+    def __init__(self, database_file, synchronous="NORMAL", cache_size=-16000, mmap_size=256 * 1024 * 1024,
+                 busy_timeout=5000, cached_statements=256):
+        """
+        Args:
+            database_file (str): Path of the SQLite database.
+            synchronous (str): PRAGMA synchronous level (OFF, NORMAL, FULL).
+            cache_size (int): PRAGMA cache_size; negative values are KiB, positive values pages.
+            mmap_size (int): Bytes of the database file to memory-map.
+            busy_timeout (int): Milliseconds to wait for a lock held by another connection.
+            cached_statements (int): Prepared statements cached per connection.
+        """
+        self.database_file = database_file
+        self.synchronous = synchronous
+        self.cache_size = cache_size
+        self.mmap_size = mmap_size
+        self.busy_timeout = busy_timeout
+        self.cached_statements = cached_statements
+        self.local = threading.local()
+        self.connections = []
+        self.lock = threading.Lock()
+
+    def connect(self):
+        """
+        Return the calling thread's connection, opening it on first use.
+        Like sqlite3.connect(), it can be used as `with pool.connect() as conn:`
+        to commit on success and roll back on error; the connection stays open.
+        """
+        conn = getattr(self.local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.database_file, timeout=self.busy_timeout / 1000,
+                                   cached_statements=self.cached_statements, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode = WAL")
+            conn.execute(f"PRAGMA synchronous = {self.synchronous}")
+            conn.execute(f"PRAGMA cache_size = {int(self.cache_size)}")
+            conn.execute(f"PRAGMA mmap_size = {int(self.mmap_size)}")
+            conn.execute(f"PRAGMA busy_timeout = {int(self.busy_timeout)}")
+            self.local.conn = conn
+            with self.lock:
+                self.connections.append(conn)
+        return conn
+
+    def close(self):
+        """Close the connections of all threads."""
+        with self.lock:
+            for conn in self.connections:
+                conn.close()
+            self.connections.clear()
+        self.local = threading.local()
@@ -0,0 +1,175 @@
+import logging
+import threading
+import time
+
+logger = logging.getLogger("SystemLogger")
+
+
+class TokenBucket:
+    """Rate limit of rate events per second with bursts of up to burst events."""
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = max(burst, 1)
+        self.tokens = self.burst
+        self.updated = time.monotonic()
+
+    def wait_time(self):
+        """Seconds until a token is available, 0 if one is."""
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        return 0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def take(self):
+        """Take a token; only call after wait_time() returned 0."""
+        self.tokens -= 1
+
+
+class CircuitBreaker:
+    """
+    Opens after failure_threshold consecutive failures. While open, requests are refused
+    for reset_timeout seconds; then one probe request is let through (half-open), which
+    closes the circuit on success and opens it again on failure.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold, reset_timeout, probe_wait=1):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.probe_wait = probe_wait
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = None
+        self.probe_started = None
+
+    def allow(self):
+        """Returns 0 if a request may be sent now, otherwise the seconds to defer it by."""
+        now = time.monotonic()
+        if self.state == self.CLOSED:
+            return 0
+        if self.state == self.OPEN:
+            remaining = self.opened_at + self.reset_timeout - now
+            if remaining > 0:
+                return remaining
+            self.state = self.HALF_OPEN
+            self.probe_started = None
+        # Half-open: one probe at a time; a probe without result for reset_timeout is given up
+        if self.probe_started is None or now - self.probe_started > self.reset_timeout:
+            self.probe_started = now
+            return 0
+        return self.probe_wait
+
+    def record(self, success):
+        if success:
+            self.state = self.CLOSED
+            self.failures = 0
+            self.opened_at = None
+            self.probe_started = None
+            return
+        self.failures += 1
+        if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+            self.state = self.OPEN
+            self.opened_at = time.monotonic()
+            self.probe_started = None
+
+
+class DestinationGuard:
+    """
+    Token buckets and circuit breakers per destination host (host:port), consulted before
+    a task is dispatched. A task may also carry its own rate limit, enforced by a bucket of
+    that task in addition to the bucket of its host.
+    """
+
+    def __init__(self, rate=None, rates=None, burst=10, failure_threshold=5, reset_timeout=30):
+        """
+        Args:
+            rate (float): Requests per second to a host (None = unlimited).
+            rates (dict): Requests per second of single hosts, overriding rate.
+            burst (int): Requests a bucket lets through at once after being idle.
+            failure_threshold (int): Consecutive failures that open a host's circuit.
+            reset_timeout (float): Seconds a circuit stays open before a probe is sent.
+        """
+        self.rate = rate
+        self.rates = rates or {}
+        self.burst = burst
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.host_buckets = {}
+        self.task_buckets = {}
+        self.breakers = {}
+        self.lock = threading.Lock()
+
+    def acquire(self, host, task_id=None, task_rate=None):
+        """
+        Check whether a request to host may be sent now. Returns (0, None) and takes the
+        tokens if so, otherwise the seconds to defer the task by and the reason
+        ("circuit_open" or "rate_limited").
+        """
+        with self.lock:
+            breaker = self.breakers.get(host)
+            if breaker is None:
+                breaker = CircuitBreaker(self.failure_threshold, self.reset_timeout)
+                self.breakers[host] = breaker
+            buckets = []
+            rate = self.rates.get(host, self.rate)
+            if rate:
+                bucket = self.host_buckets.get(host)
+                if bucket is None or bucket.rate != rate:
+                    bucket = TokenBucket(rate, self.burst)
+                    self.host_buckets[host] = bucket
+                buckets.append(bucket)
+            if task_rate:
+                bucket = self.task_buckets.get(task_id)
+                if bucket is None or bucket.rate != task_rate:
+                    bucket = TokenBucket(task_rate, 1)
+                    self.task_buckets[task_id] = bucket
+                buckets.append(bucket)
+            # Check the buckets before the breaker so a refused request does not use up the probe
+            for bucket in buckets:
+                wait = bucket.wait_time()
+                if wait:
+                    return wait, "rate_limited"
+            delay = breaker.allow()
+            if delay:
+                return delay, "circuit_open"
+            for bucket in buckets:
+                bucket.take()
+            return 0, None
+
+    def record(self, host, success):
+        """Record the outcome of a request to host."""
+        with self.lock:
+            breaker = self.breakers.get(host)
+            if breaker is None:
+                return
+            previous = breaker.state
+            breaker.record(success)
+            if breaker.state != previous and breaker.state != CircuitBreaker.HALF_OPEN:
+                logger.warning(f"Circuit of {host} {breaker.state}"
+                               + (f" after {breaker.failures} consecutive failures" if not success else ""))
+
+    def forget_task(self, task_id):
+        """Drop the bucket of a deleted task."""
+        with self.lock:
+            self.task_buckets.pop(task_id, None)
+
+    def open_circuits(self):
+        with self.lock:
+            return sum(1 for breaker in self.breakers.values() if breaker.state != CircuitBreaker.CLOSED)
+
+    def state(self):
+        """Circuit and rate limit state of every host seen so far."""
+        now = time.monotonic()
+        with self.lock:
+            destinations = []
+            for host, breaker in sorted(self.breakers.items()):
+                entry = {"host": host, "circuit": breaker.state, "consecutive_failures": breaker.failures,
+                         "rate_limit": self.rates.get(host, self.rate)}
+                if breaker.state == CircuitBreaker.OPEN:
+                    entry["retry_in"] = round(max(breaker.opened_at + breaker.reset_timeout - now, 0), 1)
+                destinations.append(entry)
+            return destinations
@@ -0,0 +1,97 @@
+import math
+from retention import RetentionJob
+
+# Percentiles reported by ExecutionHistory.stats()
+PERCENTILES = (50, 90, 99)
+
+
+def init_history_table(cursor):
+    """Create the append-only executions table and its index if they do not exist."""
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS executions (
+        id INTEGER PRIMARY KEY,
+        task_id INTEGER NOT NULL,
+        started_at INTEGER NOT NULL,
+        duration_ms INTEGER NOT NULL,
+        status_code INTEGER,
+        success INTEGER NOT NULL,
+        bytes_received INTEGER NOT NULL
+    )
+    """)
+    cursor.execute("""
+    CREATE INDEX IF NOT EXISTS idx_executions_task_started ON executions (task_id, started_at)
+    """)
+    cursor.execute("""
+    CREATE INDEX IF NOT EXISTS idx_executions_started ON executions (started_at)
+    """)
+
+
+class ExecutionHistory:
+    """Records one row per task execution and answers latency statistics over time windows."""
+
+    def __init__(self, db, writer, retention_days=7, max_rows=None, purge_interval=600, purge_batch=1000):
+        """
+        Args:
+            db (SQLitePool): Connection pool of the tasks database.
+            writer (BatchWriter): Writer the inserts are batched through.
+            retention_days (float): Executions older than this are deleted (None = no age limit).
+            max_rows (int): Only the newest max_rows executions are kept (None = no limit).
+            purge_interval (float): Seconds between retention runs.
+            purge_batch (int): Rows deleted per purge statement, so the lock is held briefly.
+        """
+        self.db = db
+        self.writer = writer
+        self.retention = RetentionJob(db, "executions", "started_at",
+                                      max_age=retention_days * 86400 if retention_days is not None else None,
+                                      max_rows=max_rows, cutoff_value=lambda cutoff: int(cutoff * 1000),
+                                      interval=purge_interval, batch_size=purge_batch)
+        self.retention.start()
+
+    def record(self, task_id, started_at, duration_ms, status_code, success, bytes_received):
+        """Queue an execution row; it is committed with the writer's next batch."""
+        self.writer.submit("""
+        INSERT INTO executions (task_id, started_at, duration_ms, status_code, success, bytes_received)
+        VALUES (?, ?, ?, ?, ?, ?)
+        """, (task_id, started_at, duration_ms, status_code, int(success), bytes_received))
+
+    def stats(self, task_id, since, until):
+        """
+        Return counts and latency percentiles of a task's executions with
+        since <= started_at < until (epoch milliseconds). The aggregation and the
+        percentile ranking run in SQLite; only the requested ranks are returned.
+        """
+        conn = self.db.connect()
+        count, successes, total_bytes, minimum, average, maximum = conn.execute("""
+        SELECT COUNT(*), COALESCE(SUM(success), 0), COALESCE(SUM(bytes_received), 0),
+               MIN(duration_ms), AVG(duration_ms), MAX(duration_ms)
+        FROM executions
+        WHERE task_id = ? AND started_at >= ? AND started_at < ?
+        """, (task_id, since, until)).fetchone()
+        latency = {"min": minimum, "avg": round(average, 1) if average is not None else None, "max": maximum}
+        if count:
+            # Nearest-rank percentiles
+            ranks = {p: max(math.ceil(p / 100 * count), 1) for p in PERCENTILES}
+            rows = conn.execute(f"""
+            SELECT rank, duration_ms FROM (
+                SELECT duration_ms, ROW_NUMBER() OVER (ORDER BY duration_ms) AS rank
+                FROM executions
+                WHERE task_id = ? AND started_at >= ? AND started_at < ?
+            )
+            WHERE rank IN ({", ".join("?" * len(ranks))})
+            """, (task_id, since, until, *ranks.values())).fetchall()
+            by_rank = dict(rows)
+            for p, rank in ranks.items():
+                latency[f"p{p}"] = by_rank.get(rank)
+        else:
+            for p in PERCENTILES:
+                latency[f"p{p}"] = None
+        return {
+            "count": count,
+            "success_count": successes,
+            "failure_count": count - successes,
+            "bytes_received": total_bytes,
+            "latency_ms": latency,
+        }
+
+    def stop(self):
+        self.retention.stop()
@@ -0,0 +1,199 @@
+import threading
+import time
+from urllib.parse import urlparse
+import requests
+import urllib3
+from requests.adapters import HTTPAdapter
+
+# Size of the chunks a streamed response body is read in (bytes)
+CHUNK_SIZE = 64 * 1024
+
+
+class CapturedResponse:
+    """
+    Status and a bounded preview of a response whose body was streamed and not kept.
+    size is the number of body bytes read; if truncated, the body was larger and
+    size is only a lower bound.
+    """
+
+    __slots__ = ("status_code", "reason", "preview", "size", "truncated")
+
+    def __init__(self, status_code, reason, preview, size, truncated):
+        self.status_code = status_code
+        self.reason = reason
+        self.preview = preview
+        self.size = size
+        self.truncated = truncated
+
+    @property
+    def ok(self):
+        return self.status_code < 400
+
+    def __repr__(self):
+        return f"<Response [{self.status_code}]>"
+
+
+def body_chunks(response):
+    """
+    Decoded body of a response sent with stream=True, in chunks of at most CHUNK_SIZE bytes.
+    Each chunk is returned after a single socket read, so a body that trickles in is seen as
+    it arrives rather than once a whole chunk is complete.
+    """
+    raw = response.raw
+    if not hasattr(raw, "read1"):
+        # urllib3 1.x
+        yield from response.iter_content(CHUNK_SIZE)
+        return
+    while True:
+        try:
+            chunk = raw.read1(CHUNK_SIZE, decode_content=True)
+        except urllib3.exceptions.ReadTimeoutError as e:
+            raise requests.exceptions.ReadTimeout(e) from e
+        except urllib3.exceptions.HTTPError as e:
+            raise requests.exceptions.ConnectionError(e) from e
+        if not chunk:
+            return
+        yield chunk
+
+
+def capture_response(response, capture_bytes, drain_bytes, deadline=None):
+    """
+    Read a response sent with stream=True, keeping only its first capture_bytes bytes.
+    Up to drain_bytes bytes are read and counted so the connection can be reused; a larger
+    body is abandoned and its connection closed instead of being downloaded. If the body is
+    not complete at deadline (time.monotonic()), the response is closed and requests.Timeout
+    raised; a read already waiting can overrun the deadline by at most one read timeout.
+    """
+    kept = bytearray()
+    size = 0
+    truncated = False
+    try:
+        for chunk in body_chunks(response):
+            if len(kept) < capture_bytes:
+                kept += chunk[:capture_bytes - len(kept)]
+            size += len(chunk)
+            if size > drain_bytes:
+                truncated = True
+                break
+            if deadline is not None and time.monotonic() > deadline:
+                raise requests.exceptions.Timeout(f"Response body incomplete after {size} bytes at the deadline")
+    finally:
+        response.close()
+    try:
+        preview = bytes(kept).decode(response.encoding or "utf-8", errors="replace")
+    except LookupError:
+        preview = bytes(kept).decode("utf-8", errors="replace")
+    return CapturedResponse(response.status_code, response.reason, preview, size, truncated)
+
+
+class HTTPSessionPool:
+    """Thread-safe pool of keep-alive HTTP sessions, one per scheme, host and port."""
+
+    def __init__(self, pool_size=10, keep_alive=True, connect_timeout=5, read_timeout=30, idle_timeout=60):
+        """
+        Args:
+            pool_size (int): Connections kept open per destination.
+            keep_alive (bool): Reuse connections between requests.
+            connect_timeout (float): Seconds to wait for a connection.
+            read_timeout (float): Seconds to wait for the response.
+            idle_timeout (float): Seconds after which an unused destination's connections are closed.
+        """
+        self.pool_size = pool_size
+        self.keep_alive = keep_alive
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.idle_timeout = idle_timeout
+        self.sessions = {}
+        self.lock = threading.Lock()
+        self.last_sweep = time.monotonic()
+        # Counters of sessions that were already closed, so stats() stays cumulative
+        self.evicted_requests = 0
+        self.evicted_connections = 0
+        self.evictions = 0
+
+    def request(self, method, url, timeout=None, **kwargs):
+        """
+        Send a request over the pooled session of the URL's destination.
+        Args:
+            method (str): The HTTP method.
+            url (str): The endpoint URL.
+            timeout (float): Read timeout overriding the pool default.
+        """
+        session = self.session_for(url)
+        read_timeout = self.read_timeout if timeout is None else timeout
+        return session.request(method, url, timeout=(self.connect_timeout, read_timeout), **kwargs)
+
+    def session_for(self, url):
+        """Return the session of the URL's scheme, host and port, creating it if needed."""
+        parsed = urlparse(url)
+        key = (parsed.scheme, parsed.hostname, parsed.port)
+        now = time.monotonic()
+        with self.lock:
+            if now - self.last_sweep >= self.idle_timeout / 2:
+                self.evict_idle(now)
+            entry = self.sessions.get(key)
+            if entry is None:
+                entry = [self.create_session(parsed.scheme), now]
+                self.sessions[key] = entry
+            entry[1] = now
+            return entry[0]
+
+    def create_session(self, scheme):
+        """Create a session whose adapter keeps up to pool_size connections alive."""
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size, max_retries=0)
+        session.mount(f"{scheme}://", adapter)
+        if not self.keep_alive:
+            session.headers["Connection"] = "close"
+        return session
+
+    def evict_idle(self, now):
+        """Close sessions that have not been used for idle_timeout seconds. Caller holds the lock."""
+        self.last_sweep = now
+        for key, (session, last_used) in list(self.sessions.items()):
+            if now - last_used >= self.idle_timeout:
+                requests_sent, connections = self.session_counts(session)
+                self.evicted_requests += requests_sent
+                self.evicted_connections += connections
+                self.evictions += 1
+                session.close()
+                del self.sessions[key]
+
+    @staticmethod
+    def session_counts(session):
+        """Return the number of requests sent and connections opened by a session."""
+        requests_sent = 0
+        connections = 0
+        for adapter in session.adapters.values():
+            for key in adapter.poolmanager.pools.keys():
+                pool = adapter.poolmanager.pools.get(key)
+                if pool is not None:
+                    requests_sent += pool.num_requests
+                    connections += pool.num_connections
+        return requests_sent, connections
+
+    def close(self):
+        """Close all pooled sessions."""
+        with self.lock:
+            self.evict_idle(float("inf"))
+            self.last_sweep = time.monotonic()
+
+    def stats(self):
+        """
+        Return pool statistics. A hit is a request sent over an already open
+        connection, a miss is a request that had to open a new one.
+        """
+        with self.lock:
+            requests_sent = self.evicted_requests
+            connections = self.evicted_connections
+            for session, _ in self.sessions.values():
+                session_requests, session_connections = self.session_counts(session)
+                requests_sent += session_requests
+                connections += session_connections
+            return {
+                "destinations": len(self.sessions),
+                "requests": requests_sent,
+                "hits": max(requests_sent - connections, 0),
+                "misses": connections,
+                "evictions": self.evictions,
+            }
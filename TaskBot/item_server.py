@@ -1,17 +1,47 @@
-import http.server
-import socketserver
+import argparse
 import json
 import sqlite3
 from urllib.parse import urlparse, parse_qs
+import threading
 import time
 from datetime import datetime, timedelta
+from pooled_server import PooledHTTPServer, PooledRequestHandler, serve, json_array_chunks
+from db_pool import SQLitePool, storable
+from batch_writer import BatchWriter
+from retention import RetentionJob, enable_incremental_vacuum
+from metrics import REGISTRY, DB_OPERATION_DURATION, timed
 
 # Initialize SQLite Database
 DATABASE_FILE = "items.db"
+# SQLite tuning: PRAGMA synchronous level, page cache (negative = KiB),
+# memory-mapped bytes and milliseconds to wait for a lock
+DB_SYNCHRONOUS = "NORMAL"
+DB_CACHE_SIZE = -16000
+DB_MMAP_SIZE = 256 * 1024 * 1024
+DB_BUSY_TIMEOUT = 5000
+# Inserts of concurrent POST /items requests are committed together in batches of up to
+# WRITE_BATCH_SIZE requests, waiting at most WRITE_BATCH_DELAY seconds for a batch to fill
+WRITE_BATCH_SIZE = 500
+WRITE_BATCH_DELAY = 0.005
+# Largest page GET /items returns when a limit is given
+MAX_PAGE_SIZE = 10000
+# Largest number of items accepted in one POST /items request
+MAX_INGEST_ITEMS = 100000
+# Items older than ITEM_RETENTION_DAYS are deleted and at most ITEM_MAX_ROWS are kept
+# (None = no limit, the default: items are only deleted when an operator sets a limit);
+# the retention job runs every RETENTION_INTERVAL seconds and deletes RETENTION_BATCH_SIZE
+# rows per transaction
+ITEM_RETENTION_DAYS = None
+ITEM_MAX_ROWS = None
+RETENTION_INTERVAL = 300
+RETENTION_BATCH_SIZE = 1000
+
+ITEMS_INGESTED = REGISTRY.counter("items_ingested_total", "Items stored through POST /items")
 
 def init_db():
     """Initialize the SQLite database and create the items table if not exists."""
-    with sqlite3.connect(DATABASE_FILE) as conn:
+    with db.connect() as conn:
+        enable_incremental_vacuum(conn)
         cursor = conn.cursor()
         cursor.execute("""
         CREATE TABLE IF NOT EXISTS items (
@@ -20,23 +50,64 @@ def init_db():
             payload TEXT
         )
         """)
+        # Range queries by time; the index also orders by id within a timestamp
+        cursor.execute("""
+        CREATE INDEX IF NOT EXISTS idx_items_timestamp ON items (timestamp)
+        """)
         conn.commit()
 
-class MyHandler(http.server.SimpleHTTPRequestHandler):
-    def _set_headers(self, status_code=200):
+def parse_timestamp(value):
+    """Normalize an ISO 8601 query value to the format stored in the timestamp column."""
+    try:
+        return datetime.fromisoformat(value).isoformat()
+    except ValueError:
+        raise ValueError(f"Invalid date format: {value}")
+
+def parse_items(content):
+    """Parse a POST /items body: one item object, a JSON array of items or NDJSON (one item per line)."""
+    stripped = content.strip()
+    if stripped.startswith('['):
+        items = json.loads(stripped)
+    else:
+        try:
+            items = [json.loads(stripped)]
+        except json.JSONDecodeError:
+            # More than one JSON document: NDJSON
+            items = [json.loads(line) for line in stripped.splitlines() if line.strip()]
+    if not items:
+        raise ValueError("No items")
+    if len(items) > MAX_INGEST_ITEMS:
+        raise ValueError(f"At most {MAX_INGEST_ITEMS} items per request")
+    for item in items:
+        if not isinstance(item, dict) or "payload" not in item:
+            raise ValueError("Every item needs a 'payload'")
+        if not storable(item["payload"]):
+            raise ValueError("'payload' must be a string, a number or null")
+    return items
+
+
+
+class MyHandler(PooledRequestHandler):
+    def _set_headers(self, status_code=200, content_length=0):
         """Set HTTP headers with the specified status code."""
         self.send_response(status_code)
         self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(content_length))
         self.end_headers()
 
+    def _send_json(self, status_code, data):
+        """Send data as a JSON response with the specified status code."""
+        body = json.dumps(data).encode()
+        self._set_headers(status_code, len(body))
+        self.wfile.write(body)
+
     def _read_content(self):
         """Read and parse the request body."""
-        content_length = int(self.headers.get('Content-Length', 0))
-        return self.rfile.read(content_length).decode('utf-8')
+        return self.read_body().decode('utf-8')
 
     def fetch_items(self, item_id=None):
         """Fetch items from the database."""
-        with sqlite3.connect(DATABASE_FILE) as conn:
+        with timed(DB_OPERATION_DURATION, "fetch_items"), db.connect() as conn:
             cursor = conn.cursor()
             if item_id:
                 cursor.execute("SELECT * FROM items WHERE id = ?", (item_id,))
@@ -45,24 +116,102 @@ class MyHandler(http.server.SimpleHTTPRequestHandler):
                 cursor.execute("SELECT * FROM items")
                 return cursor.fetchall()
 
-    def add_item(self, item_data):
-        """Add an item to the database."""
-        with sqlite3.connect(DATABASE_FILE) as conn:
-            cursor = conn.cursor()
-            now = datetime.now().isoformat()
+    def query_items(self, query):
+        """
+        Build the item list query from the GET /items parameters since, until (ISO 8601),
+        after (the X-Next-After cursor of the previous page) and limit.
+        Returns a cursor over the matching rows ordered by timestamp and id.
+        """
+        conditions = []
+        params = []
+        if 'since' in query:
+            conditions.append("timestamp >= ?")
+            params.append(parse_timestamp(query['since'][0]))
+        if 'until' in query:
+            conditions.append("timestamp < ?")
+            params.append(parse_timestamp(query['until'][0]))
+        if 'after' in query:
+            timestamp, _, item_id = query['after'][0].rpartition(',')
+            if not timestamp:
+                raise ValueError("after must be the X-Next-After value of the previous page")
+            conditions.append("(timestamp, id) > (?, ?)")
+            params.extend((parse_timestamp(timestamp), int(item_id)))
+        sql = "SELECT id, timestamp, payload FROM items"
+        if conditions:
+            sql += " WHERE " + " AND ".join(conditions)
+        sql += " ORDER BY timestamp, id"
+        if 'limit' in query:
+            limit = int(query['limit'][0])
+            if not 0 < limit <= MAX_PAGE_SIZE:
+                raise ValueError(f"limit must be between 1 and {MAX_PAGE_SIZE}")
+            sql += " LIMIT ?"
+            params.append(limit)
+        cursor = db.connect().cursor()
+        with timed(DB_OPERATION_DURATION, "list_items"):
+            cursor.execute(sql, params)
+        return cursor
+
+    def list_items(self, query):
+        """
+        Send the item list. A page requested with limit is sent at once with the cursor of
+        the next page in X-Next-After; without limit the rows are streamed from the cursor.
+        """
+        try:
+            cursor = self.query_items(query)
+        except ValueError as e:
+            self._send_json(400, {"error": "Invalid query", "details": str(e)})
+            return
+        if 'limit' in query:
+            rows = cursor.fetchall()
+            body = json.dumps([{"id": t[0], "timestamp": t[1], "payload": t[2]} for t in rows]).encode()
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            if len(rows) == int(query['limit'][0]):
+                self.send_header('X-Next-After', f"{rows[-1][1]},{rows[-1][0]}")
+            self.end_headers()
+            self.wfile.write(body)
+        else:
+            def rows():
+                while True:
+                    batch = cursor.fetchmany(500)
+                    if not batch:
+                        return
+                    for t in batch:
+                        yield {"id": t[0], "timestamp": t[1], "payload": t[2]}
             try:
-                cursor.execute("""
-                INSERT INTO items (timestamp, payload)
-                VALUES (?, ?)
-                """, (now, item_data["payload"]))
-                conn.commit()
-                return True, None
-            except sqlite3.IntegrityError as e:
-                return False, str(e)
+                self.send_chunked(200, json_array_chunks(rows()))
+            finally:
+                cursor.close()
+
+    def add_items(self, items):
+        """
+        Insert items through the batch writer and wait until they are committed, so the
+        inserts of concurrent requests share one transaction. The items are stored all
+        together or not at all; returns the error if they were not.
+        """
+        now = datetime.now().isoformat()
+        committed = threading.Event()
+        errors = []
+
+        def failed(error):
+            errors.append(error)
+            committed.set()
+
+        with timed(DB_OPERATION_DURATION, "add_items"):
+            writer.submit_many("""
+            INSERT INTO items (timestamp, payload)
+            VALUES (?, ?)
+            """, [(now, item["payload"]) for item in items], callback=committed.set, errback=failed)
+            committed.wait()
+        if errors:
+            return errors[0]
+        ITEMS_INGESTED.inc(amount=len(items))
+        return None
 
     def update_item(self, item_id, item_data):
         """Update an existing item in the database."""
-        with sqlite3.connect(DATABASE_FILE) as conn:
+        with timed(DB_OPERATION_DURATION, "update_item"), db.connect() as conn:
             cursor = conn.cursor()
             now = datetime.now().isoformat()
             cursor.execute("""
@@ -75,7 +224,7 @@ class MyHandler(http.server.SimpleHTTPRequestHandler):
 
     def delete_item(self, item_id):
         """Delete an item from the database."""
-        with sqlite3.connect(DATABASE_FILE) as conn:
+        with timed(DB_OPERATION_DURATION, "delete_item"), db.connect() as conn:
             cursor = conn.cursor()
             try:
                 cursor.execute("DELETE FROM items WHERE id = ?", (item_id,))
@@ -86,44 +235,44 @@ class MyHandler(http.server.SimpleHTTPRequestHandler):
                 return False
 
     def do_POST(self):
-        """Handle POST requests to add a new item."""
+        """Handle POST requests to add one item, a JSON array of items or NDJSON."""
         if self.path == '/items':
             try:
-                item_data = json.loads(self._read_content())
-                success, error = self.add_item(item_data)
-                if success:
-                    self._set_headers(201)
-                    self.wfile.write(json.dumps({"message": "item added"}).encode())
-                else:
-                    self._set_headers(409)
-                    self.wfile.write(json.dumps({"error": error}).encode())
+                items = parse_items(self._read_content())
             except Exception as e:
-                self._set_headers(400)
-                self.wfile.write(json.dumps({"error": "Invalid data", "details": str(e)}).encode())
+                self._send_json(400, {"error": "Invalid data", "details": str(e)})
+                return
+            error = self.add_items(items)
+            if error is not None:
+                self._send_json(500, {"error": "Items not stored", "details": str(error)})
+                return
+            if len(items) == 1:
+                self._send_json(201, {"message": "item added"})
+            else:
+                self._send_json(201, {"message": "items added", "count": len(items)})
+        else:
+            self._send_json(404, {"error": "Not found"})
 
     def do_GET(self):
         """Handle GET requests to retrieve items."""
         parsed_path = urlparse(self.path)
         query = parse_qs(parsed_path.query)
-        if parsed_path.path == '/items':
+        if parsed_path.path == '/metrics':
+            self.send_metrics()
+        elif parsed_path.path == '/items':
             item_id = query.get('id', [None])[0]
             if item_id:
                 item = self.fetch_items(item_id)
                 if item:
-                    self._set_headers(200)
-                    self.wfile.write(json.dumps({
+                    self._send_json(200, {
                         "id": item[0], "timestamp": item[1], "payload": item[2]
-                    }).encode())
+                    })
                 else:
-                    self._set_headers(404)
-                    self.wfile.write(json.dumps({"error": "item not found"}).encode())
+                    self._send_json(404, {"error": "item not found"})
             else:
-                items = self.fetch_items()
-                self._set_headers(200)
-                self.wfile.write(json.dumps([
-                    {"id": t[0], "timestamp": t[1], "payload": t[2]}
-                    for t in items
-                ]).encode())
+                self.list_items(query)
+        else:
+            self._send_json(404, {"error": "Not found"})
 
     def do_PUT(self):
         """Handle PUT requests to update an item."""
@@ -135,11 +284,13 @@ class MyHandler(http.server.SimpleHTTPRequestHandler):
                 item_data = json.loads(self._read_content())
                 success = self.update_item(item_id, item_data)
                 if success:
-                    self._set_headers(200)
-                    self.wfile.write(json.dumps({"message": "item updated"}).encode())
+                    self._send_json(200, {"message": "item updated"})
                 else:
-                    self._set_headers(404)
-                    self.wfile.write(json.dumps({"error": "item not found"}).encode())
+                    self._send_json(404, {"error": "item not found"})
+            else:
+                self._send_json(400, {"error": "Missing 'id' parameter"})
+        else:
+            self._send_json(404, {"error": "Not found"})
 
     def do_DELETE(self):
         """Handle DELETE requests to remove an item."""
@@ -150,20 +301,40 @@ class MyHandler(http.server.SimpleHTTPRequestHandler):
             if item_id:
                 success = self.delete_item(item_id)
                 if success:
-                    self._set_headers(200)
-                    self.wfile.write(json.dumps({"message": "item deleted"}).encode())
+                    self._send_json(200, {"message": "item deleted"})
                 else:
-                    self._set_headers(404)
-                    self.wfile.write(json.dumps({"error": "item not found"}).encode())
+                    self._send_json(404, {"error": "item not found"})
             else:
-                self._set_headers(400)
-                self.wfile.write(json.dumps({"error": "Missing 'id' parameter"}).encode())
+                self._send_json(400, {"error": "Missing 'id' parameter"})
+        else:
+            self._send_json(404, {"error": "Not found"})
+
+PORT = 8001
+parser = argparse.ArgumentParser(description="TaskBot item server")
+parser.add_argument("--port", type=int, default=PORT, help="port to serve on")
+parser.add_argument("--retention-days", type=float, default=ITEM_RETENTION_DAYS,
+                    help="delete items older than this many days (default: keep them)")
+parser.add_argument("--max-rows", type=int, default=ITEM_MAX_ROWS, help="keep only the newest MAX_ROWS items")
+args = parser.parse_args()
 
 # Initialize the database
+db = SQLitePool(DATABASE_FILE, synchronous=DB_SYNCHRONOUS, cache_size=DB_CACHE_SIZE,
+                mmap_size=DB_MMAP_SIZE, busy_timeout=DB_BUSY_TIMEOUT)
 init_db()
+writer = BatchWriter(db, max_batch=WRITE_BATCH_SIZE, max_delay=WRITE_BATCH_DELAY)
+retention = RetentionJob(db, "items", "timestamp",
+                         max_age=args.retention_days * 86400 if args.retention_days else None,
+                         max_rows=args.max_rows, cutoff_value=lambda cutoff: datetime.fromtimestamp(cutoff).isoformat(),
+                         interval=RETENTION_INTERVAL, batch_size=RETENTION_BATCH_SIZE)
+retention.start()
 
 # Start the server
-PORT = 8001
-with socketserver.TCPServer(("", PORT), MyHandler) as httpd:
-    print(f"Item Server serving at port {PORT}")
-    httpd.serve_forever()
+# Connections handled at once and accept backlog of the item server
+SERVER_WORKERS = 16
+SERVER_BACKLOG = 128
+httpd = PooledHTTPServer(("", args.port), MyHandler, max_workers=SERVER_WORKERS, backlog=SERVER_BACKLOG)
+print(f"Item Server serving at port {args.port}")
+serve(httpd)
+retention.stop()
+writer.stop()
+db.close()
@@ -1,18 +1,149 @@
-import http.server
-import socketserver
+import argparse
 import json
+import signal
+import socket
 import sqlite3
+import uuid
 from urllib.parse import urlparse, parse_qs
 import threading
 import time
-from datetime import datetime, timedelta
+import heapq
+import random
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
 import requests
 import logging
-from logging.handlers import RotatingFileHandler
+from logging.handlers import RotatingFileHandler, QueueHandler, QueueListener
 import os
+import queue
+from collections import deque
+from http_pool import HTTPSessionPool, capture_response
+from db_pool import SQLitePool, storable
+from batch_writer import BatchWriter
+from pooled_server import PooledHTTPServer, PooledRequestHandler, serve, json_array_chunks
+from metrics import REGISTRY, DB_OPERATION_DURATION, timed
+from execution_history import ExecutionHistory, init_history_table
+from retention import enable_incremental_vacuum
+from destination_guard import DestinationGuard
+from response_cache import ResponseCache, CACHE_REQUESTS, etag, etag_matches
+from task_registry import TaskRegistry
+from cron import compile_cron, normalize
+from sharding import shard_paths, shard_of, init_shard_layout
+from task_logging import TaskLogRouter, is_task_record, is_system_record, drop_record
 
 # Initialize SQLite Database
 DATABASE_FILE = "tasks.db"
+# Number of SQLite files tasks are spread over by a hash of their name. Every shard has its own
+# write lock, batch writer and scheduler, so writes to different shards do not wait for each other.
+# Change it for an existing store with reshard.py
+TASK_SHARDS = 1
+# SQLite tuning: PRAGMA synchronous level, page cache (negative = KiB),
+# memory-mapped bytes and milliseconds to wait for a lock
+DB_SYNCHRONOUS = "NORMAL"
+DB_CACHE_SIZE = -16000
+DB_MMAP_SIZE = 256 * 1024 * 1024
+DB_BUSY_TIMEOUT = 5000
+# Maximum number of due tasks fetched per scheduler tick
+DUE_BATCH_SIZE = 500
+# Columns exposed by the API, in response order
+TASK_FIELDS = ("id", "name", "operation", "type", "interval", "cron", "next_execution", "destination", "payload",
+               "misfire_policy", "jitter", "rate_limit", "retry_policy", "status", "attempts", "last_error")
+# Largest page GET /tasks returns when a limit is given
+MAX_PAGE_SIZE = 10000
+# Columns written when a task is created, in task_values() order
+TASK_INSERT_COLUMNS = ("name, operation, type, interval, next_execution, next_execution_ts, destination, "
+                       "destination_host, payload, misfire_policy, jitter, rate_limit, retry_policy, cron")
+# Task types that run repeatedly: every interval seconds, or at the times of a cron expression
+REPEATING_TYPES = ("interval", "cron")
+# What to do with an interval task that starts more than MISFIRE_GRACE seconds late:
+# coalesce runs it once and schedules the next run one interval from now, skip drops the
+# late run and waits for the next slot, fire_all runs every missed slot back to back
+MISFIRE_POLICIES = ("coalesce", "skip", "fire_all")
+DEFAULT_MISFIRE_POLICY = "coalesce"
+MISFIRE_GRACE = 5
+# Largest interval and jitter a task may have (seconds)
+MAX_INTERVAL = 10 * 365 * 86400
+MAX_JITTER = 86400
+# At most MAX_DISPATCH_PER_TICK due tasks are claimed per tick; if more are due the next
+# tick follows after DISPATCH_TICK seconds, so a backlog is spread out instead of fired at once
+MAX_DISPATCH_PER_TICK = 200
+DISPATCH_TICK = 0.1
+# Names looked up per query when applying a batch (stays below SQLite's variable limit)
+BATCH_LOOKUP_SIZE = 500
+# Serialized GET /tasks responses kept in memory, the largest body cached and the bytes
+# all cached bodies may take together
+RESPONSE_CACHE_ENTRIES = 256
+RESPONSE_CACHE_MAX_BODY = 4 * 1024 * 1024
+RESPONSE_CACHE_MAX_BYTES = 32 * 1024 * 1024
+# API reads are served from an in-memory copy of the tasks table, which checks the database for
+# changes of other processes at most every REGISTRY_SYNC_INTERVAL seconds. Deleted tasks are
+# remembered for TOMBSTONE_TTL seconds so the copies can catch up incrementally
+REGISTRY_SYNC_INTERVAL = 0.1
+TOMBSTONE_TTL = 3600
+# Retry policy of tasks that do not set their own: total attempts per run including the
+# first one, delay before the first retry (seconds), its growth per attempt, the largest delay
+# and the status codes worth retrying (a missing response is always retried). A single task
+# whose last attempt fails is moved to the dead-letter state; an interval or cron task waits
+# for its next regular run, unless dead_letter is set
+DEFAULT_RETRY_POLICY = {"max_attempts": 5, "base_delay": 1, "multiplier": 2, "max_delay": 300,
+                        "retry_on": [408, 425, 429, 500, 502, 503, 504], "dead_letter": False}
+# Limits of the values a task's retry policy may set (attempts, multiplier, delays in seconds)
+MAX_RETRY_ATTEMPTS = 100
+MAX_RETRY_MULTIPLIER = 100
+MAX_RETRY_DELAY = 86400
+# A task whose execution raised an unexpected error is tried again after this many seconds
+ERROR_RETRY_DELAY = 60
+# Number of worker threads executing tasks in parallel
+MAX_WORKERS = 32
+# Maximum number of tasks running against the same destination host at once. Further due
+# tasks for a busy host wait in its queue of up to MAX_PENDING_PER_DESTINATION tasks without
+# holding a worker; when the queue is full they are deferred by DESTINATION_BUSY_DELAY seconds
+MAX_PER_DESTINATION = 4
+MAX_PENDING_PER_DESTINATION = 32
+DESTINATION_BUSY_DELAY = 1
+# Timeout of an outbound task request (seconds)
+TASK_TIMEOUT = 30
+# Schedule updates after executions are committed in batches of up to WRITE_BATCH_SIZE
+# statements, waiting at most WRITE_BATCH_DELAY seconds for a batch to fill
+WRITE_BATCH_SIZE = 500
+WRITE_BATCH_DELAY = 0.005
+# Outbound requests per second to one destination host (None = unlimited), overrides for
+# single hosts ("host:port" keys) and the burst allowed after a quiet period. Tasks over the
+# limit are deferred until a token is available
+DESTINATION_RATE_LIMIT = None
+DESTINATION_RATE_LIMITS = {}
+DESTINATION_BURST = 10
+# The circuit of a destination opens after CIRCUIT_FAILURE_THRESHOLD consecutive failed requests
+# (no response or 5xx); its tasks are deferred until a probe is let through CIRCUIT_RESET_TIMEOUT seconds later
+CIRCUIT_FAILURE_THRESHOLD = 5
+CIRCUIT_RESET_TIMEOUT = 30
+# Outbound connection pool: connections kept per destination, keep-alive,
+# connect timeout and idle time after which a destination's connections are closed (seconds)
+HTTP_POOL_SIZE = 10
+HTTP_KEEP_ALIVE = True
+HTTP_CONNECT_TIMEOUT = 5
+HTTP_IDLE_TIMEOUT = 60
+# Response bodies are streamed: the first RESPONSE_CAPTURE_BYTES are kept as a preview for the
+# task log, and at most RESPONSE_DRAIN_BYTES are read (and counted) before the connection is dropped
+RESPONSE_CAPTURE_BYTES = 1024
+RESPONSE_DRAIN_BYTES = 1024 * 1024
+# Level of the console output: DEBUG shows every request, OFF silences the console
+# (system.log always gets everything)
+CONSOLE_LOG_LEVEL = "INFO"
+# Due tasks are claimed with a lease (owner and expiry) so several processes can share
+# one task store. Leases of claimed tasks are renewed every LEASE_RENEW_INTERVAL seconds;
+# the claims of a worker that died are taken over LEASE_DURATION seconds after its last renewal
+LEASE_DURATION = 120
+LEASE_RENEW_INTERVAL = 30
+# Seconds between checks for tasks scheduled by other processes
+SCHEDULE_POLL_INTERVAL = 1
+# Maximum number of task log files kept open at once
+MAX_OPEN_TASK_LOGS = 128
+# Executions older than HISTORY_RETENTION_DAYS are purged every HISTORY_PURGE_INTERVAL seconds,
+# keeping at most HISTORY_MAX_ROWS of them (None = no limit)
+HISTORY_RETENTION_DAYS = 7
+HISTORY_MAX_ROWS = None
+HISTORY_PURGE_INTERVAL = 600
 
 # Configure the system logger
 system_logger = logging.getLogger("SystemLogger")
@@ -28,16 +159,50 @@ file_handler.setFormatter(logging.Formatter('%(asctime)s - %(levelname)s - %(mes
 console_handler = logging.StreamHandler()
 console_handler.setFormatter(logging.Formatter('%(asctime)s - %(levelname)s - %(message)s'))
 
+# Task log files, one per task, with the least recently used ones closed
+task_log_router = TaskLogRouter('logs', max_open=MAX_OPEN_TASK_LOGS,
+                                formatter=logging.Formatter('%(asctime)s - %(levelname)s - %(message)s'))
+file_handler.addFilter(is_system_record)
+console_handler.addFilter(is_system_record)
+task_log_router.addFilter(is_task_record)
+
+# Loggers only put records on a queue; a background thread writes them,
+# so request and execution threads never block on disk I/O
+log_queue = queue.SimpleQueue()
+log_listener = QueueListener(log_queue, file_handler, console_handler, task_log_router, respect_handler_level=True)
+log_listener.start()
+
 # Add handlers to the logger
-system_logger.addHandler(file_handler)
-system_logger.addHandler(console_handler)
+system_logger.addHandler(QueueHandler(log_queue))
+
+# All task loggers share this logger; records carry the task name
+task_base_logger = logging.getLogger("TaskLogger")
+task_base_logger.setLevel(logging.DEBUG)
+task_base_logger.propagate = False
+task_base_logger.addHandler(QueueHandler(log_queue))
 
 system_logger.debug("SERVER STARTED")
 
 
-def init_db():
-    # Initialize the SQLite database and create the tasks table if not exists.
-    with sqlite3.connect(DATABASE_FILE) as conn:
+def now_ms():
+    # Current time in epoch milliseconds, the unit of next_execution_ts.
+    return int(time.time() * 1000)
+
+def to_epoch_ms(next_execution):
+    # Convert an ISO 8601 next_execution string to epoch milliseconds for the indexed column.
+    if next_execution is None:
+        return None
+    try:
+        return int(datetime.fromisoformat(next_execution).timestamp() * 1000)
+    except (TypeError, ValueError):
+        raise ValueError(f"Invalid date format: {next_execution}")
+
+def init_db(db, shard=0, shard_count=1):
+    # Initialize a task database (shard of shard_count) and create the tasks table if not exists.
+    # Raises ValueError if the database belongs to another shard layout.
+    with db.connect() as conn:
+        if enable_incremental_vacuum(conn):
+            system_logger.debug("Incremental vacuum enabled")
         cursor = conn.cursor()
         cursor.execute("""
         CREATE TABLE IF NOT EXISTS tasks (
@@ -51,105 +216,736 @@ def init_db():
             payload TEXT
         )
         """)
+        init_shard_layout(cursor, shard, shard_count)
+        migrate_next_execution_ts(cursor)
+        migrate_destination_host(cursor)
+        add_column(cursor, "lease_owner", "TEXT")
+        add_column(cursor, "lease_expires", "INTEGER")
+        add_column(cursor, "misfire_policy", f"TEXT NOT NULL DEFAULT '{DEFAULT_MISFIRE_POLICY}'")
+        add_column(cursor, "jitter", "REAL NOT NULL DEFAULT 0")
+        add_column(cursor, "rate_limit", "REAL")
+        add_column(cursor, "retry_policy", "TEXT")
+        add_column(cursor, "status", "TEXT NOT NULL DEFAULT 'active'")
+        add_column(cursor, "attempts", "INTEGER NOT NULL DEFAULT 0")
+        add_column(cursor, "last_error", "TEXT")
+        add_column(cursor, "row_version", "INTEGER")
+        add_column(cursor, "cron", "TEXT")
+        init_task_version(cursor)
+        init_history_table(cursor)
+        cursor.execute("""
+        CREATE INDEX IF NOT EXISTS idx_tasks_next_execution_ts ON tasks (next_execution_ts)
+        """)
+        cursor.execute("""
+        CREATE INDEX IF NOT EXISTS idx_tasks_destination_host ON tasks (destination_host)
+        """)
+        cursor.execute("""
+        CREATE INDEX IF NOT EXISTS idx_tasks_row_version ON tasks (row_version)
+        """)
         conn.commit()
     system_logger.debug("Database initialized")
 
+def init_task_version(cursor):
+    # Data version of the tasks table, bumped by triggers on every change of a column the API
+    # returns. Being in the database, it also counts changes made by other processes.
+    # Changed rows are stamped with the new version in row_version and deleted ones leave a
+    # tombstone, so a TaskRegistry can fetch just the changes since the version it has.
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS task_version (
+        id INTEGER PRIMARY KEY CHECK (id = 0),
+        version INTEGER NOT NULL
+    )
+    """)
+    cursor.execute("INSERT OR IGNORE INTO task_version (id, version) VALUES (0, 0)")
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS task_tombstones (
+        version INTEGER PRIMARY KEY,
+        task_id INTEGER NOT NULL,
+        deleted_at INTEGER NOT NULL
+    )
+    """)
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_task_tombstones_deleted_at ON task_tombstones (deleted_at)")
+    now = "CAST((julianday('now') - 2440587.5) * 86400000 AS INTEGER)"
+    stamp_row = "UPDATE tasks SET row_version = (SELECT version FROM task_version WHERE id = 0) WHERE id = NEW.id;"
+    add_tombstone = f"""
+            INSERT INTO task_tombstones (version, task_id, deleted_at)
+            VALUES ((SELECT version FROM task_version WHERE id = 0), OLD.id, {now});
+            DELETE FROM task_tombstones WHERE deleted_at < {now} - {int(TOMBSTONE_TTL * 1000)};"""
+    # Recreated on every start so the triggers follow changes of TASK_FIELDS
+    for event, action in (("INSERT", stamp_row), (f"UPDATE OF {', '.join(TASK_FIELDS)}", stamp_row),
+                          ("DELETE", add_tombstone)):
+        name = f"tasks_version_{event.split()[0].lower()}"
+        cursor.execute(f"DROP TRIGGER IF EXISTS {name}")
+        cursor.execute(f"""
+        CREATE TRIGGER {name} AFTER {event} ON tasks
+        BEGIN
+            UPDATE task_version SET version = version + 1 WHERE id = 0;
+            {action}
+        END
+        """)
+
+def add_column(cursor, column, definition):
+    # Add a column to the tasks table if it does not exist yet. Returns True if it was added.
+    cursor.execute("PRAGMA table_info(tasks)")
+    columns = [existing[1] for existing in cursor.fetchall()]
+    if column in columns:
+        return False
+    cursor.execute(f"ALTER TABLE tasks ADD COLUMN {column} {definition}")
+    return True
+
+def migrate_next_execution_ts(cursor):
+    # Add the sortable next_execution_ts column to databases created before it existed
+    # and backfill it from the ISO next_execution strings.
+    if not add_column(cursor, "next_execution_ts", "INTEGER"):
+        return
+    cursor.execute("SELECT id, name, next_execution FROM tasks")
+    backfill = []
+    for task_id, name, next_execution in cursor.fetchall():
+        try:
+            backfill.append((to_epoch_ms(next_execution), task_id))
+        except ValueError as e:
+            # Leave the column NULL so the task is never picked up as due
+            system_logger.warning(f"Task {name} not migrated: {e}")
+    cursor.executemany("UPDATE tasks SET next_execution_ts = ? WHERE id = ?", backfill)
+    system_logger.debug(f"Migrated next_execution_ts for {len(backfill)} tasks")
+
+def from_epoch_ms(ts):
+    # ISO 8601 next_execution string of an epoch milliseconds timestamp.
+    return datetime.fromtimestamp(ts / 1000).isoformat()
+
+def misfire_values(task_data):
+    # Validated misfire policy and jitter (seconds) of a task, with defaults applied.
+    misfire_policy = task_data.get("misfire_policy") or DEFAULT_MISFIRE_POLICY
+    if misfire_policy not in MISFIRE_POLICIES:
+        raise ValueError(f"misfire_policy must be one of {', '.join(MISFIRE_POLICIES)}")
+    try:
+        jitter = float(task_data.get("jitter") or 0)
+    except TypeError:
+        raise ValueError("jitter must be a number") from None
+    if not 0 <= jitter <= MAX_JITTER:
+        raise ValueError(f"jitter must be between 0 and {MAX_JITTER} seconds")
+    return misfire_policy, jitter
+
+def rate_limit_value(task_data):
+    # Validated per-task rate limit (executions per second), None if the task has none.
+    rate_limit = task_data.get("rate_limit")
+    if rate_limit is None:
+        return None
+    try:
+        rate_limit = float(rate_limit)
+    except TypeError:
+        raise ValueError("rate_limit must be a number") from None
+    if rate_limit <= 0:
+        raise ValueError("rate_limit must be positive")
+    return rate_limit
+
+def retry_policy_value(task_data):
+    # Validated retry policy of a task as stored JSON, None if the task uses the default.
+    retry_policy = task_data.get("retry_policy")
+    if retry_policy is None:
+        return None
+    if not isinstance(retry_policy, dict):
+        raise ValueError("retry_policy must be an object")
+    unknown = set(retry_policy) - set(DEFAULT_RETRY_POLICY)
+    if unknown:
+        raise ValueError(f"Unknown retry_policy keys: {', '.join(sorted(unknown))}")
+    policy = {**DEFAULT_RETRY_POLICY, **retry_policy}
+    try:
+        max_attempts = int(policy["max_attempts"])
+        base_delay, multiplier, max_delay = (float(policy[key]) for key in ("base_delay", "multiplier", "max_delay"))
+    except (TypeError, OverflowError):
+        raise ValueError("retry_policy.max_attempts, base_delay, multiplier and max_delay must be numbers") from None
+    # Written so that NaN fails every check
+    if not 1 <= max_attempts <= MAX_RETRY_ATTEMPTS:
+        raise ValueError(f"retry_policy.max_attempts must be between 1 and {MAX_RETRY_ATTEMPTS}")
+    if not 0 < base_delay <= MAX_RETRY_DELAY or not 1 <= multiplier <= MAX_RETRY_MULTIPLIER:
+        raise ValueError(f"retry_policy.base_delay must be positive and multiplier between 1 and {MAX_RETRY_MULTIPLIER}")
+    if not base_delay <= max_delay <= MAX_RETRY_DELAY:
+        raise ValueError(f"retry_policy.max_delay must be between base_delay and {MAX_RETRY_DELAY} seconds")
+    if not isinstance(policy["retry_on"], list) or not all(isinstance(code, int) for code in policy["retry_on"]):
+        raise ValueError("retry_policy.retry_on must be a list of status codes")
+    if not isinstance(policy["dead_letter"], bool):
+        raise ValueError("retry_policy.dead_letter must be true or false")
+    return json.dumps(retry_policy)
+
+def load_retry_policy(retry_policy):
+    # Retry policy of a task from its stored JSON, with the defaults filled in.
+    if retry_policy is None:
+        return DEFAULT_RETRY_POLICY
+    return {**DEFAULT_RETRY_POLICY, **json.loads(retry_policy)}
+
+def retry_delay(retry_policy, attempts):
+    # Seconds to wait before the next attempt after attempts failed ones.
+    max_delay = float(retry_policy["max_delay"])
+    try:
+        delay = float(retry_policy["base_delay"]) * float(retry_policy["multiplier"]) ** (attempts - 1)
+    except OverflowError:
+        return max_delay
+    return min(delay, max_delay)
+
+def task_dict(fields, row):
+    # API representation of a task row with the given fields.
+    task = dict(zip(fields, row))
+    if task.get("retry_policy") is not None:
+        task["retry_policy"] = json.loads(task["retry_policy"])
+    return task
+
+def cron_value(task_data):
+    # Normalized cron expression of a cron task, None for other types. Raises ValueError if it is invalid.
+    if task_data["type"] != "cron":
+        return None
+    expression = task_data.get("cron")
+    if not isinstance(expression, str):
+        raise ValueError("Cron tasks need a cron expression")
+    expression = normalize(expression)
+    compile_cron(expression)
+    return expression
+
+def next_cron_fire(expression, after_ts):
+    # Next fire time of a cron expression after epoch milliseconds after_ts, in epoch milliseconds.
+    fire_time = compile_cron(expression).next_after(datetime.fromtimestamp(after_ts / 1000))
+    return int(fire_time.timestamp() * 1000)
+
+def first_execution(task_data, cron, jitter):
+    # next_execution of a new task: as given, else the next cron time or now, spread over the jitter
+    # so the first runs of tasks created together do not all start at once.
+    next_execution = task_data.get("next_execution")
+    if next_execution is not None:
+        return next_execution
+    start_ts = next_cron_fire(cron, now_ms()) if cron else now_ms()
+    return from_epoch_ms(start_ts + int(random.uniform(0, jitter) * 1000))
+
+def check_field_types(task_data):
+    # Raise ValueError unless the fields stored as given have types the tasks table can hold.
+    for field in ("operation", "type", "destination"):
+        if not isinstance(task_data.get(field), str):
+            raise ValueError(f"{field} must be a string")
+    if not storable(task_data.get("payload")):
+        raise ValueError("payload must be a string, a number or null")
+    interval = task_data.get("interval")
+    if interval is not None and (isinstance(interval, (bool, str)) or not storable(interval)):
+        raise ValueError("interval must be a number")
+
+def check_interval(task_data, interval):
+    # Raise ValueError unless the interval (seconds) can be scheduled: an interval task needs
+    # at least 1 second, and no interval may exceed MAX_INTERVAL.
+    if interval is None:
+        if task_data["type"] == "interval":
+            raise ValueError("Interval tasks need an interval")
+        return
+    if not -MAX_INTERVAL <= interval <= MAX_INTERVAL:
+        raise ValueError(f"interval must be at most {MAX_INTERVAL} seconds")
+    if task_data["type"] == "interval" and interval < 1:
+        raise ValueError("interval must be at least 1 second")
+
+def task_values(task_data):
+    # Column values of a new task in TASK_INSERT_COLUMNS order, with defaults applied.
+    if not isinstance(task_data.get("name"), str):
+        raise ValueError("name must be a string")
+    check_field_types(task_data)
+    interval = task_data.get("interval")
+    if interval is None and task_data["type"] != "cron":
+        # default to 10 minutes if interval is None
+        interval = 600
+    check_interval(task_data, interval)
+    misfire_policy, jitter = misfire_values(task_data)
+    cron = cron_value(task_data)
+    next_execution = first_execution(task_data, cron, jitter)
+    return (
+        task_data["name"],
+        task_data["operation"],
+        task_data["type"],
+        interval,
+        next_execution,
+        to_epoch_ms(next_execution),
+        task_data["destination"],
+        destination_host(task_data["destination"]),
+        task_data.get("payload", None),
+        misfire_policy,
+        jitter,
+        rate_limit_value(task_data),
+        retry_policy_value(task_data),
+        cron
+    )
+
+def destination_host(destination):
+    # Host name of a task destination URL, stored for filtering by destination.
+    return urlparse(destination).hostname
+
+def migrate_destination_host(cursor):
+    # Add and backfill the destination_host column used by GET /tasks?destination=.
+    if not add_column(cursor, "destination_host", "TEXT"):
+        return
+    cursor.execute("SELECT id, destination FROM tasks")
+    backfill = [(destination_host(destination), task_id) for task_id, destination in cursor.fetchall()]
+    cursor.executemany("UPDATE tasks SET destination_host = ? WHERE id = ?", backfill)
+    system_logger.debug(f"Migrated destination_host for {len(backfill)} tasks")
+
 def get_task_logger(task_name):
-    # Ensure the logs directory exists
-    if not os.path.exists('logs'):
-        os.makedirs('logs')
+    # Logger writing to logs/<task_name>.log. The file is opened by the log writer thread
+    # on first use, so nothing is created or kept per task here.
+    return logging.LoggerAdapter(task_base_logger, {"task_name": task_name})
 
-    # Create or retrieve the logger
-    task_logger = logging.getLogger(f"TaskLogger_{task_name}")
-    # Avoid adding multiple handlers
-    if not task_logger.hasHandlers():  
-        task_logger.setLevel(logging.DEBUG)
+def drop_task_logger(task_name):
+    # Close the log file of a deleted task once its queued records are written.
+    log_queue.put_nowait(drop_record(task_name))
 
-        # File handler for the task log
-        task_file_handler = logging.FileHandler(f'logs/{task_name}.log')
-        task_file_handler.setFormatter(logging.Formatter('%(asctime)s - %(levelname)s - %(message)s'))
-        task_logger.addHandler(task_file_handler)
 
-    return task_logger
+# Scheduler metrics served by GET /metrics
+SCHEDULER_LAG = REGISTRY.histogram(
+    "scheduler_lag_seconds", "Delay between a task's next_execution and the start of its execution",
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300))
+DUE_TASKS_PER_TICK = REGISTRY.histogram(
+    "scheduler_due_tasks_per_tick", "Due tasks fetched per scheduler tick",
+    buckets=(0, 1, 5, 10, 50, 100, 250, 500, 1000))
+TASKS_DISPATCHED = REGISTRY.counter("scheduler_dispatched_total", "Tasks handed to the worker pool")
+TASK_EXECUTIONS = REGISTRY.counter("task_executions_total", "Finished task executions", ("result",))
+TASKS_DEAD_LETTERED = REGISTRY.counter("tasks_dead_lettered_total", "Tasks moved to the dead-letter state")
+TASKS_DEFERRED = REGISTRY.counter("scheduler_deferred_total", "Due tasks deferred instead of dispatched", ("reason",))
+OUTBOUND_REQUEST_DURATION = REGISTRY.histogram(
+    "outbound_request_duration_seconds", "Duration of task requests by destination host", ("host",))
 
 
 class TaskScheduler:
-    def __init__(self, database_file):
-        self.database_file = database_file
+    def __init__(self, db, due_batch_size=DUE_BATCH_SIZE, max_workers=MAX_WORKERS,
+                 max_per_destination=MAX_PER_DESTINATION, task_timeout=TASK_TIMEOUT, http_pool=None,
+                 worker_id=None, lease_duration=LEASE_DURATION, lease_renew_interval=LEASE_RENEW_INTERVAL,
+                 poll_interval=SCHEDULE_POLL_INTERVAL, max_dispatch_per_tick=MAX_DISPATCH_PER_TICK,
+                 dispatch_tick=DISPATCH_TICK, guard=None, registry=None):
+        self.db = db
+        self.due_batch_size = due_batch_size
+        self.max_per_destination = max_per_destination
+        self.task_timeout = task_timeout
         self.running = True
-        system_logger.debug("Task Scheduler started")
+        # Owner written to the lease of claimed tasks; unique per process so a restarted
+        # worker never renews the claims of its predecessor
+        if worker_id is None:
+            worker_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self.worker_id = worker_id
+        self.lease_duration = lease_duration
+        self.lease_renew_interval = lease_renew_interval
+        self.poll_interval = poll_interval
+        self.next_poll = 0
+        self.max_dispatch_per_tick = max_dispatch_per_tick
+        self.dispatch_tick = dispatch_tick
+        if http_pool is None:
+            http_pool = HTTPSessionPool(pool_size=HTTP_POOL_SIZE, keep_alive=HTTP_KEEP_ALIVE,
+                                        connect_timeout=HTTP_CONNECT_TIMEOUT, read_timeout=task_timeout,
+                                        idle_timeout=HTTP_IDLE_TIMEOUT)
+        self.http_pool = http_pool
+        if guard is None:
+            guard = DestinationGuard(rate=DESTINATION_RATE_LIMIT, rates=DESTINATION_RATE_LIMITS,
+                                     burst=DESTINATION_BURST, failure_threshold=CIRCUIT_FAILURE_THRESHOLD,
+                                     reset_timeout=CIRCUIT_RESET_TIMEOUT)
+        self.guard = guard
+        if registry is None:
+            registry = TaskRegistry(db, sync_interval=REGISTRY_SYNC_INTERVAL, tombstone_ttl=TOMBSTONE_TTL)
+        self.registry = registry
+        self.writer = BatchWriter(db, max_batch=WRITE_BATCH_SIZE, max_delay=WRITE_BATCH_DELAY)
+        REGISTRY.gauge("scheduler_in_flight_tasks", "Tasks queued or running on the worker pool",
+                       callback=lambda: {(): len(self.in_flight)})
+        REGISTRY.gauge("scheduler_scheduled_tasks", "Tasks with a fire time in the scheduler heap",
+                       callback=lambda: {(): len(self.scheduled)})
+        # The pool and the guard may be shared by the schedulers of several shards; count them once
+        REGISTRY.gauge("http_pool_requests", "Outbound requests by connection reuse", ("connection",),
+                       callback=lambda: self.http_pool_counts(), owner=self.http_pool)
+        REGISTRY.gauge("destination_open_circuits", "Destinations whose circuit is open or half-open",
+                       callback=lambda: {(): self.guard.open_circuits()}, owner=self.guard)
+        self.history = ExecutionHistory(db, self.writer, retention_days=HISTORY_RETENTION_DAYS,
+                                        max_rows=HISTORY_MAX_ROWS, purge_interval=HISTORY_PURGE_INTERVAL)
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="TaskWorker")
+        # Ids of tasks queued or running on the pool, so a task never runs twice at once.
+        # At most due_batch_size tasks are in flight; when that limit is reached the loop
+        # waits for a task to finish (backlog) before fetching more.
+        self.in_flight = set()
+        self.backlog = False
+        # Tasks running per destination host and the queues of those waiting for a slot
+        self.destination_running = {}
+        self.destination_pending = {}
+        self.dispatch_lock = threading.Lock()
+        # Upcoming fire times as a heap of (next_execution_ts, task_id). Entries that no
+        # longer match self.scheduled are stale and skipped when they reach the top.
+        self.deadlines = []
+        self.scheduled = {}
+        self.condition = threading.Condition()
+        self.wakeup = False
+        self.lease_stopped = threading.Event()
+        self.lease_thread = threading.Thread(target=self.lease_renewal_loop, name="LeaseRenewal", daemon=True)
+        self.lease_thread.start()
+        system_logger.debug(f"Task Scheduler started as {self.worker_id}")
+
+    def load_schedule(self):
+        # Load the fire times of all tasks from the task registry into the in-memory heap.
+        self.registry.sync(force=True)
+        rows = self.registry.due_times()
+        with self.condition:
+            self.scheduled = {task_id: next_execution_ts for task_id, next_execution_ts in rows}
+            self.deadlines = [(next_execution_ts, task_id) for task_id, next_execution_ts in rows]
+            heapq.heapify(self.deadlines)
+            self.condition.notify()
+        system_logger.debug(f"Loaded schedule for {len(rows)} tasks")
+
+    def schedule(self, task_id, next_execution_ts):
+        # Set the next fire time of a task and wake the loop if it is now the earliest one.
+        with self.condition:
+            if next_execution_ts is None:
+                self.scheduled.pop(task_id, None)
+                return
+            self.scheduled[task_id] = next_execution_ts
+            heapq.heappush(self.deadlines, (next_execution_ts, task_id))
+            if self.deadlines[0] == (next_execution_ts, task_id):
+                self.condition.notify()
+
+    def schedule_many(self, entries):
+        # Set the fire times of many (task_id, next_execution_ts) pairs and wake the loop once.
+        with self.condition:
+            for task_id, next_execution_ts in entries:
+                if next_execution_ts is None:
+                    self.scheduled.pop(task_id, None)
+                    continue
+                self.scheduled[task_id] = next_execution_ts
+                heapq.heappush(self.deadlines, (next_execution_ts, task_id))
+            self.condition.notify()
 
-    def fetch_due_tasks(self):
-        # Fetch tasks that are due for execution.
-        with sqlite3.connect(self.database_file) as conn:
+    def unschedule(self, task_id):
+        # Forget the fire time of a deleted task; its heap entry is dropped lazily.
+        with self.condition:
+            self.scheduled.pop(task_id, None)
+        self.guard.forget_task(task_id)
+
+    def wake(self):
+        # Make the loop check the database right away.
+        with self.condition:
+            self.wakeup = True
+            self.condition.notify()
+
+    def poll_after(self, delay):
+        # Make the loop check the database again after delay seconds at the latest.
+        with self.condition:
+            self.next_poll = min(self.next_poll, now_ms() + int(delay * 1000))
+            self.condition.notify()
+
+    def stop(self):
+        # Stop the execution loop, let running tasks finish and give up the remaining claims.
+        with self.condition:
+            self.running = False
+            self.condition.notify()
+        self.executor.shutdown(wait=True, cancel_futures=True)
+        self.lease_stopped.set()
+        self.writer.submit("UPDATE tasks SET lease_owner = NULL, lease_expires = NULL WHERE lease_owner = ?",
+                           (self.worker_id,))
+        self.history.stop()
+        self.writer.stop()
+        self.http_pool.close()
+
+    def wait_for_due(self):
+        # Sleep until the earliest scheduled task is due or the poll interval has passed,
+        # and pop all due entries. The heap only knows tasks scheduled by this process,
+        # so the database is also checked every poll_interval seconds.
+        # Returns False when the scheduler was stopped.
+        with self.condition:
+            while self.running:
+                while self.deadlines and self.scheduled.get(self.deadlines[0][1]) != self.deadlines[0][0]:
+                    heapq.heappop(self.deadlines)
+                now = now_ms()
+                if self.wakeup or now >= self.next_poll or (self.deadlines and self.deadlines[0][0] <= now):
+                    self.wakeup = False
+                    self.next_poll = now + int(self.poll_interval * 1000)
+                    while self.deadlines and self.deadlines[0][0] <= now:
+                        next_execution_ts, task_id = heapq.heappop(self.deadlines)
+                        if self.scheduled.get(task_id) == next_execution_ts:
+                            del self.scheduled[task_id]
+                    return True
+                wake_at = min(self.deadlines[0][0], self.next_poll) if self.deadlines else self.next_poll
+                self.condition.wait((wake_at - now) / 1000)
+            return False
+
+    def claim_due_tasks(self, limit=None, exclude=()):
+        # Claim due tasks without a live lease, oldest first, using the next_execution_ts index.
+        # The lease is set in the same UPDATE that selects the tasks, so a task is claimed by
+        # at most one process. Tasks whose id is in exclude (already in flight) are skipped.
+        if limit is None:
+            limit = self.due_batch_size
+        exclude = list(exclude)
+        with timed(DB_OPERATION_DURATION, "claim_due"), self.db.connect() as conn:
             cursor = conn.cursor()
-            now = datetime.now().isoformat()
-            # Parse next_execution as ISO 8601 before comparing
-            def parse_isoformat(next_execution):
-                try:
-                    return datetime.fromisoformat(next_execution)
-                except ValueError:
-                    raise ValueError(f"Invalid date format: {next_execution}")
-            
+            now = now_ms()
+            # Read-only check first, so polls that find nothing due never take the write lock
             cursor.execute("""
-            SELECT id, name, operation, type, interval, destination, payload, next_execution
-            FROM tasks
-            """)
-            
-            # Filter the tasks in Python
-            all_tasks = cursor.fetchall()
-            due_tasks = [
-                task for task in all_tasks
-                if parse_isoformat(task[-1]) <= datetime.fromisoformat(now)
-            ]
-            return due_tasks
+            SELECT 1 FROM tasks
+            WHERE next_execution_ts <= ? AND (lease_expires IS NULL OR lease_expires <= ?)
+            LIMIT 1
+            """, (now, now))
+            if cursor.fetchone() is None:
+                return []
+            cursor.execute(f"""
+            UPDATE tasks SET lease_owner = ?, lease_expires = ?
+            WHERE id IN (
+                SELECT id FROM tasks
+                WHERE next_execution_ts <= ? AND (lease_expires IS NULL OR lease_expires <= ?)
+                  AND id NOT IN ({", ".join("?" * len(exclude))})
+                ORDER BY next_execution_ts
+                LIMIT ?
+            )
+            RETURNING id, name, operation, type, interval, destination, payload, next_execution, misfire_policy, jitter,
+                      rate_limit, retry_policy, attempts, cron
+            """, (self.worker_id, now + self.lease_duration * 1000, now, now, *exclude, limit))
+            return cursor.fetchall()
+
+    def lease_renewal_loop(self):
+        # Extend the leases of all tasks claimed by this worker while they wait for or run on the pool.
+        while not self.lease_stopped.wait(self.lease_renew_interval):
+            self.writer.submit("UPDATE tasks SET lease_expires = ? WHERE lease_owner = ?",
+                               (now_ms() + self.lease_duration * 1000, self.worker_id))
+
+    def dispatch(self, task):
+        # Queue a due task on the worker pool unless it is already in flight. A task whose
+        # destination is over its rate limit or has an open circuit is deferred instead. If its
+        # destination already runs max_per_destination tasks, the task waits in the destination's
+        # queue (deferred if that is full), so a slow host never ties up the workers.
+        host = urlparse(task[5]).netloc
+        with self.dispatch_lock:
+            if task[0] in self.in_flight:
+                return False
+            self.in_flight.add(task[0])
+            busy = len(self.destination_pending.get(host, ())) >= MAX_PENDING_PER_DESTINATION
+        if busy:
+            self.defer(task, DESTINATION_BUSY_DELAY, "destination_busy")
+            return False
+        delay, reason = self.guard.acquire(host, task[0], task[10])
+        if delay:
+            self.defer(task, delay, reason)
+            return False
+        with self.dispatch_lock:
+            if self.destination_running.get(host, 0) >= self.max_per_destination:
+                self.destination_pending.setdefault(host, deque()).append(task)
+                return True
+            self.destination_running[host] = self.destination_running.get(host, 0) + 1
+        self.executor.submit(self.run_task, task, host)
+        return True
+
+    def defer(self, task, delay, reason):
+        # Move a due task delay seconds into the future without executing it.
+        TASKS_DEFERRED.inc(reason)
+        self.reschedule(task[0], now_ms() + max(int(delay * 1000), 1))
+        get_task_logger(task[1]).info(f"Task deferred by {delay:.2f}s: {reason}")
+        self.writer.call(lambda: self.release(task[0]))
+
+    def run_task(self, task, host):
+        # Worker entry point: execute the task in one of its destination's slots, then pass
+        # the slot on to the next task waiting for the destination.
+        try:
+            next_execution_ts = to_epoch_ms(task[7])
+            if next_execution_ts is not None:
+                SCHEDULER_LAG.observe(max(now_ms() - next_execution_ts, 0) / 1000)
+            self.execute_task(task)
+        finally:
+            # The task stays in flight until its schedule update is committed,
+            # otherwise the due query could still see the old next_execution
+            self.writer.call(lambda: self.release(task[0]))
+            self.start_next(host)
+
+    def start_next(self, host):
+        # Give the slot of a finished task to the next task queued for its destination, or free it.
+        with self.dispatch_lock:
+            pending = self.destination_pending.get(host)
+            if not pending:
+                self.destination_pending.pop(host, None)
+                self.destination_running[host] -= 1
+                if not self.destination_running[host]:
+                    del self.destination_running[host]
+                return
+            task = pending.popleft()
+        try:
+            self.executor.submit(self.run_task, task, host)
+        except RuntimeError:
+            # The pool is shut down; stop() gives up the remaining claims
+            pass
+
+    def release(self, task_id):
+        # Mark a task as no longer in flight and resume fetching if the loop was waiting for capacity.
+        with self.dispatch_lock:
+            self.in_flight.discard(task_id)
+            backlog, self.backlog = self.backlog, False
+        if backlog:
+            self.wake()
+
+    def http_pool_counts(self):
+        # Outbound requests sent over a reused (hit) or a new (miss) connection.
+        stats = self.http_pool.stats()
+        return {("reused",): stats["hits"], ("new",): stats["misses"]}
+
+    def wait_for_capacity(self):
+        # Wake the loop as soon as fewer than due_batch_size tasks are in flight.
+        with self.dispatch_lock:
+            ready = len(self.in_flight) < self.due_batch_size
+            self.backlog = not ready
+        if ready:
+            self.wake()
+
+    def reschedule(self, task_id, next_execution_ts, attempts=None, last_error=None):
+        # Queue the new fire time of an executed task and release its lease; the writer
+        # commits it together with other executions. Unless attempts is given, the failed
+        # attempt count is kept (a deferred task keeps its place in the retry sequence).
+        self.writer.submit("""
+        UPDATE tasks SET next_execution = ?, next_execution_ts = ?, lease_owner = NULL, lease_expires = NULL,
+                         attempts = COALESCE(?, attempts), last_error = CASE WHEN ? IS NULL THEN last_error ELSE ? END
+        WHERE id = ? AND lease_owner = ?
+        """, (from_epoch_ms(next_execution_ts), next_execution_ts, attempts, attempts, last_error,
+              task_id, self.worker_id))
+        changes = {"next_execution": from_epoch_ms(next_execution_ts), "next_execution_ts": next_execution_ts}
+        if attempts is not None:
+            changes["attempts"] = attempts
+        if last_error is not None:
+            changes["last_error"] = last_error
+        self.registry.update(task_id, **changes)
+        self.schedule(task_id, next_execution_ts)
+
+    def dead_letter(self, task_id, attempts, last_error):
+        # Park a task whose last attempt failed; it stays in the database but is never due
+        # again until it is updated through the API.
+        TASKS_DEAD_LETTERED.inc()
+        self.writer.submit("""
+        UPDATE tasks SET status = 'dead', next_execution_ts = NULL, attempts = ?, last_error = ?,
+                         lease_owner = NULL, lease_expires = NULL
+        WHERE id = ? AND lease_owner = ?
+        """, (attempts, last_error, task_id, self.worker_id))
+        self.registry.update(task_id, status="dead", next_execution_ts=None, attempts=attempts, last_error=last_error)
+        self.schedule(task_id, None)
+
+    def next_run(self, task, scheduled_ts, misfired):
+        # Next regular fire time of a claimed interval or cron task.
+        _, _, _, task_type, interval, _, _, _, misfire_policy, jitter, _, _, _, cron = task
+        if task_type == 'cron':
+            return self.next_cron_run(scheduled_ts, cron, misfire_policy, jitter, misfired)
+        return self.next_interval_run(scheduled_ts, interval, misfire_policy, jitter, misfired)
+
+    def next_cron_run(self, scheduled_ts, cron, misfire_policy, jitter, misfired):
+        # Fire time after a run of a cron task, plus random jitter. fire_all catches up on every
+        # missed time; otherwise missed times are dropped and the next one still ahead is used.
+        if misfired and misfire_policy == "fire_all":
+            next_ts = next_cron_fire(cron, scheduled_ts)
+        else:
+            next_ts = next_cron_fire(cron, max(now_ms(), scheduled_ts))
+        if jitter:
+            next_ts += int(random.uniform(0, jitter) * 1000)
+        return next_ts
+
+    def next_interval_run(self, scheduled_ts, interval, misfire_policy, jitter, misfired):
+        # Fire time after a run of an interval task, following its misfire policy, plus random jitter.
+        interval_ms = int(interval) * 1000
+        now = now_ms()
+        if misfired and misfire_policy == "skip":
+            # First slot of the original schedule that is still ahead
+            next_ts = scheduled_ts + ((now - scheduled_ts) // interval_ms + 1) * interval_ms
+        elif misfired and misfire_policy == "fire_all":
+            # The next missed slot, which is due right away until the task has caught up
+            next_ts = scheduled_ts + interval_ms
+        else:
+            next_ts = now + interval_ms
+        if jitter:
+            next_ts += int(random.uniform(0, jitter) * 1000)
+        return next_ts
 
     def execute_task(self, task):
         # Execute the task and update the database accordingly.
-        task_id, name, operation, task_type, interval, destination, payload, next_execution = task
-        print(f"Executing task: {name}")
-        system_logger.info(f"Executing task: {name}")
+        (task_id, name, operation, task_type, interval, destination, payload, next_execution,
+         misfire_policy, jitter, _, retry_policy, attempts, cron) = task
+        scheduled_ts = to_epoch_ms(next_execution)
+        misfired = task_type in REPEATING_TYPES and now_ms() - scheduled_ts > MISFIRE_GRACE * 1000
+        if misfired and misfire_policy == 'skip':
+            next_exec_ts = self.next_run(task, scheduled_ts, misfired)
+            self.reschedule(task_id, next_exec_ts)
+            TASK_EXECUTIONS.inc("skipped")
+            system_logger.info(f"Skipped misfired task: {name}")
+            get_task_logger(name).warning(f"Run due at {next_execution} misfired and was skipped, "
+                                          f"next execution at {from_epoch_ms(next_exec_ts)}")
+            return
+        system_logger.debug(f"Executing task: {name}")
         # Get the logger for the task
         task_logger = get_task_logger(name)
         task_logger.info("Executing task...")
 
         try:
             # Perform the task operation
-            success, response = self.make_request(destination, method=operation, data=payload)
+            started_at = now_ms()
+            start = time.monotonic()
+            success, response = self.make_request(destination, method=operation, data=payload,
+                                                  timeout=self.task_timeout)
+            duration_ms = int((time.monotonic() - start) * 1000)
+            # Only missing responses and server errors count against the destination's circuit
+            self.guard.record(urlparse(destination).netloc, response is not None and response.status_code < 500)
+            if response is not None:
+                task_logger.debug(f"Response: HTTP {response.status_code}, {response.size} bytes"
+                                  f"{' (truncated)' if response.truncated else ''}: {response.preview}")
+            OUTBOUND_REQUEST_DURATION.observe(duration_ms / 1000, str(destination_host(destination)))
+            TASK_EXECUTIONS.inc("success" if success else "failure")
+            self.history.record(task_id, started_at, duration_ms,
+                                response.status_code if response is not None else None, success,
+                                response.size if response is not None else 0)
             task_logger.info(f"Execution info: Destination: {destination}, Operation: {operation}, Payload: {payload}")
 
-            # Update task schedule
-            with sqlite3.connect(self.database_file) as conn:
-                cursor = conn.cursor()
-                if task_type == 'interval':
-                    next_exec_time = datetime.now() + timedelta(seconds=int(interval))
-                    cursor.execute("""
-                    UPDATE tasks SET next_execution = ? WHERE id = ?
-                    """, (next_exec_time.isoformat(), task_id))
-                    if success:
-                        task_logger.info("Task execution successful")
-                    else:
-                        task_logger.warning(f"Task execution failed. Response: {response}")
-                    task_logger.info(f"Task scheduled for next execution at {next_exec_time.isoformat()}")
-                elif task_type == 'single' and success:
-                    cursor.execute("DELETE FROM tasks WHERE id = ?", (task_id,))
-                    system_logger.info(f"Task deleted: {name}")
-                    task_logger.info("Task deleted")
-                conn.commit()
+            # Queue the task schedule update; the writer commits it together with other executions
+            if success and task_type in REPEATING_TYPES:
+                next_exec_ts = self.next_run(task, scheduled_ts, misfired)
+                self.reschedule(task_id, next_exec_ts, attempts=0)
+                task_logger.info("Task execution successful")
+                task_logger.info(f"Task scheduled for next execution at {from_epoch_ms(next_exec_ts)}")
+            elif success:
+                self.writer.submit("DELETE FROM tasks WHERE id = ?", (task_id,))
+                self.registry.discard(task_id)
+                system_logger.info(f"Task deleted: {name}")
+                task_logger.info("Task deleted")
+                drop_task_logger(name)
+            else:
+                self.handle_failure(task, response, scheduled_ts, misfired, task_logger)
         except Exception as e:
-            print(f"Error executing task {name}: {e}")
-            system_logger.error(f"Task execution failed: {name}")
+            system_logger.error(f"Task execution failed: {name}: {e}")
             task_logger.error(f"Error executing task: {e}")
+            # Give up the claim, and move the task ahead so a persistent error does not run
+            # it again on every poll
+            self.reschedule(task_id, now_ms() + ERROR_RETRY_DELAY * 1000, attempts=attempts, last_error=f"Error: {e}")
 
-    def make_request(self,url, method=None, params=None, data=None, headers=None):
+    def handle_failure(self, task, response, scheduled_ts, misfired, task_logger):
+        # Schedule the next attempt of a failed task with exponential backoff through the due-time
+        # index. Once no attempt is left, a single task (or a repeating one with dead_letter set)
+        # moves to the dead-letter state; other repeating tasks wait for their next regular run.
+        task_id, name, _, task_type, _, _, _, _, _, _, _, retry_policy, attempts, _ = task
+        policy = load_retry_policy(retry_policy)
+        attempts += 1
+        error = f"HTTP {response.status_code}" if response is not None else "No response"
+        task_logger.warning(f"Task execution failed (attempt {attempts}). Response: {response}")
+        retryable = response is None or response.status_code in policy["retry_on"]
+        if retryable and attempts < int(policy["max_attempts"]):
+            retry_ts = now_ms() + int(retry_delay(policy, attempts) * 1000)
+            if task_type in REPEATING_TYPES:
+                # A retry never waits longer than the next regular run would
+                retry_ts = min(retry_ts, self.next_run(task, scheduled_ts, misfired))
+            self.reschedule(task_id, retry_ts, attempts=attempts, last_error=error)
+            task_logger.info(f"Task retry {attempts} scheduled at {from_epoch_ms(retry_ts)}")
+        elif task_type not in REPEATING_TYPES or (retryable and policy["dead_letter"]):
+            self.dead_letter(task_id, attempts, error)
+            system_logger.warning(f"Task moved to dead-letter state after {attempts} attempts: {name} ({error})")
+            task_logger.error(f"Task moved to dead-letter state after {attempts} attempts: {error}")
+        else:
+            # Out of retries or not worth retrying; run again at the next regular time
+            if retryable:
+                task_logger.error(f"Task failed after {attempts} attempts: {error}")
+            next_exec_ts = self.next_run(task, scheduled_ts, misfired)
+            self.reschedule(task_id, next_exec_ts, attempts=0, last_error=error)
+            task_logger.info(f"Task scheduled for next execution at {from_epoch_ms(next_exec_ts)}")
+
+    def make_request(self,url, method=None, params=None, data=None, headers=None, timeout=None):
         """
-        Sends an HTTP request and prints the response.
+        Sends an HTTP request and streams the response, keeping only a bounded preview.
+        Returns whether the status is successful (2xx/3xx) and a CapturedResponse, or None
+        if no response was received.
         Args:
             url (str): The endpoint URL.
             method (str): The HTTP method (GET, POST, PUT, DELETE).
             params (dict): URL query parameters.
             data (dict/str): Request body payload.
             headers (dict): HTTP headers.
+            timeout (float): Seconds the whole request, including reading the body, may take.
         """
 
         if headers is None:
@@ -158,176 +954,459 @@ class TaskScheduler:
         if isinstance(data, dict):  
             data = json.dumps(data)
 
+        # The timeout bounds each read; the deadline bounds the whole request including the body
+        deadline = time.monotonic() + timeout if timeout is not None else None
         try:
-            response = requests.request(method, url, params=params, data=data, headers=headers)
-            print(f"Request: {method} {url}")
-            if params:
-                print(f"Params: {params}")
-            if data:
-                print(f"Data: {data}")
-            print(f"Status Code: {response.status_code}")
-            print(f"Response: {response.text}")
-            print("\n")
-            # Return True for successful HTTP status codes (2xx), and the response
-            return  response.ok, response
+            response = self.http_pool.request(method, url, params=params, data=data, headers=headers,
+                                              timeout=timeout, stream=True)
+            response = capture_response(response, RESPONSE_CAPTURE_BYTES, RESPONSE_DRAIN_BYTES, deadline)
+            system_logger.debug(f"Request: {method} {url} -> {response.status_code} ({response.size} bytes)")
+            return response.ok, response
         except requests.RequestException as e:
-            print(f"Error during request: {e}")
-            return  False, None
+            system_logger.warning(f"Error during request {method} {url}: {e}")
+            return False, None
 
     def task_execution_loop(self):
-        # Continuously check and execute due tasks.
-        print("Task Scheduler running...")
-        # TODO: Add a way to stop the scheduler
-        while self.running:
+        # Sleep until the earliest task is due, then claim all due tasks and hand them to the worker pool.
+        system_logger.debug("Task Scheduler running...")
+        self.load_schedule()
+        while self.wait_for_due():
             try:
-                due_tasks = self.fetch_due_tasks()
+                with self.dispatch_lock:
+                    in_flight = list(self.in_flight)
+                capacity = self.due_batch_size - len(in_flight)
+                if capacity <= 0:
+                    self.wait_for_capacity()
+                    continue
+                limit = min(capacity, self.max_dispatch_per_tick)
+                due_tasks = self.claim_due_tasks(limit, exclude=in_flight)
+                DUE_TASKS_PER_TICK.observe(len(due_tasks))
                 for task in due_tasks:
-                    self.execute_task(task)
+                    if self.dispatch(task):
+                        TASKS_DISPATCHED.inc()
+                if len(due_tasks) == capacity:
+                    # More tasks may be due than fit in the pool, fetch the rest once tasks finish
+                    self.wait_for_capacity()
+                elif len(due_tasks) == limit:
+                    # More tasks may be due than one tick dispatches, fetch the rest next tick
+                    self.poll_after(self.dispatch_tick)
             except Exception as e:
-                print(f"Error in task execution loop: {e}")
                 system_logger.error(f"Error in task execution loop: {e}")
-            time.sleep(1)
 
 
+class TaskShard:
+    # One task database with its in-memory registry and scheduler.
+    def __init__(self, index, db, registry, scheduler):
+        self.index = index
+        self.db = db
+        self.registry = registry
+        self.scheduler = scheduler
+
+def shard_for(task_name):
+    # Shard that stores the task with this name.
+    return shards[shard_of(task_name, len(shards))]
+
+def sync_registries():
+    # Bring the registries of all shards up to date. Returns the combined data version: the sum
+    # of the shard versions, which only grows, so it changes whenever any shard changes.
+    return sum(shard.registry.sync() for shard in shards)
 
-class MyHandler(http.server.SimpleHTTPRequestHandler):
-    def _set_headers(self, status_code=200):
+
+class MyHandler(PooledRequestHandler):
+    def _set_headers(self, status_code=200, content_length=0):
         # Set HTTP headers with the specified status code.
         self.send_response(status_code)
         self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(content_length))
         self.end_headers()
 
+    def _send_json(self, status_code, data):
+        # Send data as a JSON response with the specified status code.
+        body = json.dumps(data).encode()
+        self._set_headers(status_code, len(body))
+        self.wfile.write(body)
+
     def _read_content(self):
         # Read and parse the request body.
-        content_length = int(self.headers.get('Content-Length', 0))
-        return self.rfile.read(content_length).decode('utf-8')
+        return self.read_body().decode('utf-8')
 
     def fetch_tasks(self, task_name=None):
-        # Fetch tasks from the database.
-        with sqlite3.connect(DATABASE_FILE) as conn:
-            cursor = conn.cursor()
-            if task_name:
-                cursor.execute("SELECT * FROM tasks WHERE name = ?", (task_name,))
-                return cursor.fetchone()
+        # Fetch tasks from the in-memory registries; call sync_registries() first to see recent changes.
+        if task_name:
+            record = shard_for(task_name).registry.get(task_name)
+            return record.row(TASK_FIELDS) if record is not None else None
+        return [record.row(TASK_FIELDS) for shard in shards for record in shard.registry.select()]
+
+    def query_tasks(self, query):
+        # Select the tasks matching the GET /tasks parameters from the registries.
+        # Returns the selected fields and the matching records, ordered by id; as the id ranges
+        # of the shards follow each other, that is shard by shard.
+        fields = TASK_FIELDS
+        if 'fields' in query:
+            fields = tuple(field.strip() for field in query['fields'][0].split(',') if field.strip())
+            unknown = [field for field in fields if field not in TASK_FIELDS]
+            if unknown or not fields:
+                raise ValueError(f"Unknown fields: {', '.join(unknown)}")
+        limit = None
+        if 'limit' in query:
+            limit = int(query['limit'][0])
+            if not 0 < limit <= MAX_PAGE_SIZE:
+                raise ValueError(f"limit must be between 1 and {MAX_PAGE_SIZE}")
+        filters = dict(
+            after=int(query['after'][0]) if 'after' in query else None,
+            task_type=query['type'][0] if 'type' in query else None,
+            status=query['status'][0] if 'status' in query else None,
+            host=query['destination'][0].lower() if 'destination' in query else None,
+            next_from=to_epoch_ms(query['next_execution_from'][0]) if 'next_execution_from' in query else None,
+            next_to=to_epoch_ms(query['next_execution_to'][0]) if 'next_execution_to' in query else None
+        )
+        records = []
+        for shard in shards:
+            records += shard.registry.select(limit=None if limit is None else limit - len(records), **filters)
+            if limit is not None and len(records) >= limit:
+                break
+        return fields, records
+
+    def send_response_body(self, status_code, headers, body):
+        # Send a serialized JSON body with extra headers.
+        self.send_response(status_code)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_task_read(self, query):
+        # Answer GET /tasks from the response cache or with 304 while the data version is
+        # unchanged; otherwise build the response, tagged and cached with the version.
+        version = sync_registries()
+        headers = {'ETag': etag(version), 'Cache-Control': 'no-cache'}
+        if etag_matches(self.headers.get('If-None-Match'), headers['ETag']):
+            CACHE_REQUESTS.inc("not_modified")
+            self.send_response(304)
+            for name, value in headers.items():
+                self.send_header(name, value)
+            self.end_headers()
+            return
+        cached = response_cache.get(self.path, version)
+        if cached is not None:
+            CACHE_REQUESTS.inc("hit")
+            self.send_response_body(*cached)
+            return
+        CACHE_REQUESTS.inc("miss")
+        task_name = query.get('name', [None])[0]
+        if task_name:
+            task = self.fetch_tasks(task_name)
+            if task:
+                body = json.dumps(task_dict(TASK_FIELDS, task)).encode()
+                response_cache.put(self.path, version, (200, headers, body))
+                self.send_response_body(200, headers, body)
+                system_logger.info(f"Task Retrieved: {task_name}")
             else:
-                cursor.execute("SELECT * FROM tasks")
-                return cursor.fetchall()
+                self._send_json(404, {"error": "Task not found"})
+                system_logger.info(f"Failed to retrieve Task: {task_name}")
+        else:
+            self.list_tasks(query, version, headers)
+
+    def list_tasks(self, query, version, headers):
+        # Send the task list. A page requested with limit is sent at once with the id to
+        # continue after in X-Next-After; without limit the records are streamed as they are serialized.
+        # Either way the body is cached for the data version unless it is too large.
+        try:
+            fields, records = self.query_tasks(query)
+        except ValueError as e:
+            self._send_json(400, {"error": "Invalid query", "details": str(e)})
+            return
+        if 'limit' in query:
+            tasks = [task_dict(fields, record.row(fields)) for record in records]
+            body = json.dumps(tasks).encode()
+            if len(records) == int(query['limit'][0]):
+                headers = {**headers, 'X-Next-After': str(records[-1].id)}
+            response_cache.put(self.path, version, (200, headers, body))
+            self.send_response_body(200, headers, body)
+        else:
+            def rows():
+                for record in records:
+                    yield task_dict(fields, record.row(fields))
+
+            sent = []
+            sent_bytes = 0
+
+            def cached_chunks():
+                # Keep the streamed chunks until they exceed the cacheable size
+                nonlocal sent, sent_bytes
+                for chunk in json_array_chunks(rows()):
+                    if sent is not None:
+                        sent.append(chunk)
+                        sent_bytes += len(chunk)
+                        if sent_bytes > RESPONSE_CACHE_MAX_BODY:
+                            sent = None
+                    yield chunk
+            self.send_chunked(200, cached_chunks(), headers=headers)
+            if sent is not None:
+                response_cache.put(self.path, version, (200, headers, b"".join(sent)))
+
+    def send_task_history(self, query):
+        # Send execution counts and latency percentiles of a task, by default over the last day.
+        task_name = query.get('name', [None])[0]
+        if not task_name:
+            self._send_json(400, {"error": "Missing 'name' parameter"})
+            return
+        try:
+            until = to_epoch_ms(query['until'][0]) if 'until' in query else now_ms()
+            since = to_epoch_ms(query['since'][0]) if 'since' in query else until - 86400 * 1000
+        except ValueError as e:
+            self._send_json(400, {"error": "Invalid query", "details": str(e)})
+            return
+        shard = shard_for(task_name)
+        shard.registry.sync()
+        task = self.fetch_tasks(task_name)
+        if not task:
+            self._send_json(404, {"error": "Task not found"})
+            return
+        with timed(DB_OPERATION_DURATION, "task_history"):
+            stats = shard.scheduler.history.stats(task[0], since, until)
+        self._send_json(200, {"name": task_name, "since": datetime.fromtimestamp(since / 1000).isoformat(),
+                              "until": datetime.fromtimestamp(until / 1000).isoformat(), **stats})
 
     def add_task(self, task_data):
         # Add a task to the database.
-        with sqlite3.connect(DATABASE_FILE) as conn:
+        shard = shard_for(task_data["name"])
+        with timed(DB_OPERATION_DURATION, "add_task"), shard.db.connect() as conn:
             cursor = conn.cursor()
             try:
-                # Set default values for interval and next_execution
-                interval = task_data.get("interval")
-                if interval is None:
-                    # default to 10 minutes if interval is None
-                    interval = 600 
-                next_execution = task_data.get("next_execution")
-                if next_execution is None:
-                    next_execution = datetime.now().isoformat()
-
-                cursor.execute("""
-                INSERT INTO tasks (name, operation, type, interval, next_execution, destination, payload)
-                VALUES (?, ?, ?, ?, ?, ?, ?)
-                """, (
-                    task_data["name"],
-                    task_data["operation"],
-                    task_data["type"],
-                    interval,
-                    next_execution,
-                    task_data["destination"],
-                    task_data.get("payload", None)
-                ))
+                values = task_values(task_data)
+                cursor.execute(f"""
+                INSERT INTO tasks ({TASK_INSERT_COLUMNS})
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                """, values)
                 conn.commit()
-                # Generate the logger for the task
-                task_logger = get_task_logger(task_data["name"]) 
+                shard.registry.sync(force=True)
+                shard.scheduler.schedule(cursor.lastrowid, values[5])
                 return True, None
             except sqlite3.IntegrityError as e:
                 return False, str(e)
 
+    def lookup_task_ids(self, cursor, names):
+        # Map task names to ids for the names that exist, querying in chunks.
+        ids = {}
+        for start in range(0, len(names), BATCH_LOOKUP_SIZE):
+            chunk = names[start:start + BATCH_LOOKUP_SIZE]
+            cursor.execute(f"SELECT name, id FROM tasks WHERE name IN ({', '.join('?' * len(chunk))})", chunk)
+            ids.update(cursor.fetchall())
+        return ids
+
+    def apply_task_batch(self, items):
+        # Apply creates, upserts and deletes, in one transaction per shard.
+        # Returns one result per item, in input order.
+        results = [None] * len(items)
+        creates, upserts, deletes = [], [], []
+        seen = set()
+        for index, item in enumerate(items):
+            try:
+                if not isinstance(item, dict):
+                    raise ValueError("Item must be an object")
+                op = item.get("op", "create")
+                name = item["name"]
+                if not isinstance(name, str):
+                    raise ValueError("name must be a string")
+                if name in seen:
+                    results[index] = {"name": name, "status": 409, "error": "Duplicate name in batch"}
+                    continue
+                seen.add(name)
+                if op == "create":
+                    creates.append((index, task_values(item)))
+                elif op == "upsert":
+                    upserts.append((index, task_values(item)))
+                elif op == "delete":
+                    deletes.append((index, name))
+                else:
+                    raise ValueError(f"Unknown op: {op}")
+            except Exception as e:
+                # A bad item is reported in its result and never fails the rest of the batch
+                name = item.get("name") if isinstance(item, dict) else None
+                results[index] = {"name": name, "status": 400, "error": f"Invalid data: {e}"}
+
+        # Every shard applies its part of the batch in a transaction of its own
+        parts = {}
+        for kind, entries in enumerate((creates, upserts, deletes)):
+            for index, entry in entries:
+                name = entry if kind == 2 else entry[0]
+                parts.setdefault(shard_of(name, len(shards)), ([], [], []))[kind].append((index, entry))
+        for shard_index, (shard_creates, shard_upserts, shard_deletes) in sorted(parts.items()):
+            self.apply_shard_batch(shards[shard_index], shard_creates, shard_upserts, shard_deletes, results)
+        for index, name in deletes:
+            if results[index]["status"] == 200:
+                drop_task_logger(name)
+        return results
+
+    def apply_shard_batch(self, shard, creates, upserts, deletes, results):
+        # Apply the creates, upserts and deletes of one shard in a single transaction,
+        # filling in their entries of results.
+        with timed(DB_OPERATION_DURATION, "apply_batch"), shard.db.connect() as conn:
+            cursor = conn.cursor()
+            # Take the write lock up front so the existence checks and the writes see the same state
+            cursor.execute("BEGIN IMMEDIATE")
+            names = [values[0] for _, values in creates + upserts] + [name for _, name in deletes]
+            existing = self.lookup_task_ids(cursor, names)
+
+            inserts = []
+            for index, values in creates:
+                if values[0] in existing:
+                    results[index] = {"name": values[0], "status": 409, "error": "Task already exists"}
+                else:
+                    inserts.append(values)
+                    results[index] = {"name": values[0], "status": 201}
+            for index, values in upserts:
+                inserts.append(values)
+                results[index] = {"name": values[0], "status": 200 if values[0] in existing else 201}
+            deleted_ids = []
+            for index, name in deletes:
+                if name in existing:
+                    deleted_ids.append(existing[name])
+                    results[index] = {"name": name, "status": 200}
+                else:
+                    results[index] = {"name": name, "status": 404, "error": "Task not found"}
+
+            cursor.executemany(f"""
+            INSERT INTO tasks ({TASK_INSERT_COLUMNS})
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT(name) DO UPDATE SET
+                operation = excluded.operation, type = excluded.type, interval = excluded.interval,
+                next_execution = excluded.next_execution, next_execution_ts = excluded.next_execution_ts,
+                destination = excluded.destination, destination_host = excluded.destination_host,
+                payload = excluded.payload, misfire_policy = excluded.misfire_policy, jitter = excluded.jitter,
+                rate_limit = excluded.rate_limit, retry_policy = excluded.retry_policy, cron = excluded.cron,
+                status = 'active', attempts = 0, last_error = NULL
+            """, inserts)
+            cursor.executemany("DELETE FROM tasks WHERE id = ?", [(task_id,) for task_id in deleted_ids])
+            written = self.lookup_task_ids(cursor, [values[0] for values in inserts])
+            conn.commit()
+        shard.registry.sync(force=True)
+
+        next_execution_ts = {values[0]: values[5] for values in inserts}
+        shard.scheduler.schedule_many([(task_id, next_execution_ts[name]) for name, task_id in written.items()])
+        for task_id in deleted_ids:
+            shard.scheduler.unschedule(task_id)
+
     def update_task(self, task_name, task_data):
         # Update an existing task in the database.
-        with sqlite3.connect(DATABASE_FILE) as conn:
+        check_field_types(task_data)
+        check_interval(task_data, task_data.get("interval") if task_data["type"] == "cron" else task_data["interval"])
+        misfire_policy, jitter = misfire_values(task_data)
+        cron = cron_value(task_data)
+        # Cron tasks may leave out the interval, and next_execution to get the next cron time
+        next_execution = first_execution(task_data, cron, jitter) if cron else task_data["next_execution"]
+        shard = shard_for(task_name)
+        with timed(DB_OPERATION_DURATION, "update_task"), shard.db.connect() as conn:
             cursor = conn.cursor()
             cursor.execute("""
             UPDATE tasks
-            SET operation = ?, type = ?, interval = ?, next_execution = ?, destination = ?, payload = ?
+            SET operation = ?, type = ?, interval = ?, next_execution = ?, next_execution_ts = ?, destination = ?, destination_host = ?, payload = ?,
+                misfire_policy = ?, jitter = ?, rate_limit = ?, retry_policy = ?, cron = ?,
+                status = 'active', attempts = 0, last_error = NULL
             WHERE name = ?
             """, (
                 task_data["operation"],
                 task_data["type"],
-                task_data["interval"],
-                task_data["next_execution"],
+                task_data.get("interval") if cron else task_data["interval"],
+                next_execution,
+                to_epoch_ms(next_execution),
                 task_data["destination"],
+                destination_host(task_data["destination"]),
                 task_data.get("payload", None),
+                misfire_policy,
+                jitter,
+                rate_limit_value(task_data),
+                retry_policy_value(task_data),
+                cron,
                 task_name
             ))
             conn.commit()
+            updated = cursor.rowcount > 0
+            shard.registry.sync(force=True)
+            if updated:
+                cursor.execute("SELECT id, next_execution_ts FROM tasks WHERE name = ?", (task_name,))
+                task_id, next_execution_ts = cursor.fetchone()
+                shard.scheduler.schedule(task_id, next_execution_ts)
             # Get the logger for the task
             task_logger = get_task_logger(task_name)
             task_logger.info("Task updated") # TODO add before and after values
-            return cursor.rowcount > 0
+            return updated
 
     def delete_task(self, task_name):
         # Delete a task from the database.
-        with sqlite3.connect(DATABASE_FILE) as conn:
+        shard = shard_for(task_name)
+        with timed(DB_OPERATION_DURATION, "delete_task"), shard.db.connect() as conn:
             cursor = conn.cursor()
+            cursor.execute("SELECT id FROM tasks WHERE name = ?", (task_name,))
+            task = cursor.fetchone()
             cursor.execute("DELETE FROM tasks WHERE name = ?", (task_name,))
             conn.commit()
+            shard.registry.sync(force=True)
+            if task:
+                shard.scheduler.unschedule(task[0])
             # Get the logger for the task
             task_logger = get_task_logger(task_name)
             task_logger.info("Task deleted")
+            drop_task_logger(task_name)
             return cursor.rowcount > 0
 
 
     def do_POST(self):
-        # Handle POST requests to add a new task.
-        if self.path == '/tasks':
+        # Handle POST requests to add a new task or apply a batch of tasks.
+        if self.path == '/tasks/batch':
+            try:
+                content = self._read_content()
+                if content.lstrip().startswith('['):
+                    items = json.loads(content)
+                else:
+                    # NDJSON: one task object per line
+                    items = [json.loads(line) for line in content.splitlines() if line.strip()]
+            except ValueError as e:
+                self._send_json(400, {"error": "Invalid data", "details": str(e)})
+                system_logger.warning("Error in POST /tasks/batch: Invalid data")
+                return
+            results = self.apply_task_batch(items)
+            summary = {}
+            for result in results:
+                summary[result["status"]] = summary.get(result["status"], 0) + 1
+            self._send_json(200, {"results": results, "summary": summary})
+            system_logger.info(f"Task batch applied: {len(items)} items, {summary}")
+        elif self.path == '/tasks':
             try:
                 task_data = json.loads(self._read_content())
                 success, error = self.add_task(task_data)
                 if success:
-                    self._set_headers(201)
-                    self.wfile.write(json.dumps({"message": "Task added"}).encode())
+                    self._send_json(201, {"message": "Task added"})
                     system_logger.info(f"New task added: {task_data['name']}")
                 else:
-                    self._set_headers(409)
-                    self.wfile.write(json.dumps({"error": error}).encode())
+                    self._send_json(409, {"error": error})
                     system_logger.warning(f"Failed to add task: {task_data['name']}, Error: {error}")
             except Exception as e:
-                self._set_headers(400)
-                self.wfile.write(json.dumps({"error": "Invalid data", "details": str(e)}).encode())
+                self._send_json(400, {"error": "Invalid data", "details": str(e)})
                 system_logger.warning("Error in POST /tasks: Invalid data")
+        else:
+            self._send_json(404, {"error": "Not found"})
 
     def do_GET(self):
         # Handle GET requests to retrieve tasks.
         parsed_path = urlparse(self.path)
         query = parse_qs(parsed_path.query)
-        if parsed_path.path == '/tasks':
-            task_name = query.get('name', [None])[0]
-            if task_name:
-                task = self.fetch_tasks(task_name)
-                if task:
-                    self._set_headers(200)
-                    self.wfile.write(json.dumps({
-                        "id": task[0], "name": task[1], "operation": task[2], "type": task[3],
-                        "interval": task[4], "next_execution": task[5], "destination": task[6], "payload": task[7]
-                    }).encode())
-                    system_logger.info(f"Task Retrieved: {task_name}")
-                else:
-                    self._set_headers(404)
-                    self.wfile.write(json.dumps({"error": "Task not found"}).encode())
-                    system_logger.info(f"Failed to retrieve Task: {task_name}")
-            else:
-                tasks = self.fetch_tasks()
-                self._set_headers(200)
-                self.wfile.write(json.dumps([
-                    {
-                        "id": t[0], "name": t[1], "operation": t[2], "type": t[3],
-                        "interval": t[4], "next_execution": t[5], "destination": t[6], "payload": t[7]
-                    } for t in tasks
-                ]).encode())
+        if parsed_path.path == '/metrics':
+            self.send_metrics()
+        elif parsed_path.path == '/stats':
+            self._send_json(200, {"http_pool": http_pool.stats(),
+                                  "shards": [{"shard": shard.index, "tasks": len(shard.registry)} for shard in shards]})
+        elif parsed_path.path == '/destinations':
+            self._send_json(200, {"destinations": destination_guard.state()})
+        elif parsed_path.path == '/tasks/history':
+            self.send_task_history(query)
+        elif parsed_path.path == '/tasks':
+            self.send_task_read(query)
+        else:
+            self._send_json(404, {"error": "Not found"})
 
     def do_PUT(self):
         # Handle PUT requests to update a task.
@@ -336,16 +1415,23 @@ class MyHandler(http.server.SimpleHTTPRequestHandler):
         if parsed_path.path == '/tasks':
             task_name = query.get('name', [None])[0]
             if task_name:
-                task_data = json.loads(self._read_content())
-                success = self.update_task(task_name, task_data)
+                try:
+                    task_data = json.loads(self._read_content())
+                    success = self.update_task(task_name, task_data)
+                except (KeyError, ValueError) as e:
+                    self._send_json(400, {"error": "Invalid data", "details": str(e)})
+                    system_logger.warning("Error in PUT /tasks: Invalid data")
+                    return
                 if success:
-                    self._set_headers(200)
-                    self.wfile.write(json.dumps({"message": "Task updated"}).encode())
+                    self._send_json(200, {"message": "Task updated"})
                     system_logger.info(f"Task updated: {task_name}")
                 else:
-                    self._set_headers(404)
-                    self.wfile.write(json.dumps({"error": "Task not found"}).encode())
+                    self._send_json(404, {"error": "Task not found"})
                     system_logger.warning(f"Failed to update task: c, Error: Task not found")
+            else:
+                self._send_json(400, {"error": "Missing 'name' parameter"})
+        else:
+            self._send_json(404, {"error": "Not found"})
 
     def do_DELETE(self):
         # Handle DELETE requests to remove a task.
@@ -356,26 +1442,81 @@ class MyHandler(http.server.SimpleHTTPRequestHandler):
             if task_name:
                 success = self.delete_task(task_name)
                 if success:
-                    self._set_headers(200)
-                    self.wfile.write(json.dumps({"message": "Task deleted"}).encode())
+                    self._send_json(200, {"message": "Task deleted"})
                     system_logger.info(f"Task deleted: Task not found")
                 else:
-                    self._set_headers(404)
-                    self.wfile.write(json.dumps({"error": "Task not found"}).encode())
+                    self._send_json(404, {"error": "Task not found"})
                     system_logger.warning(f"Failed to delete task: {task_name}, Error: Task not found")
+            else:
+                self._send_json(400, {"error": "Missing 'name' parameter"})
+        else:
+            self._send_json(404, {"error": "Not found"})
 
 
-# Initialize the database
-init_db()
+def wait_for_signal():
+    # Block until SIGINT or SIGTERM; used instead of the server loop in worker mode.
+    stopped = threading.Event()
+    signal.signal(signal.SIGINT, lambda signum, frame: stopped.set())
+    signal.signal(signal.SIGTERM, lambda signum, frame: stopped.set())
+    stopped.wait()
 
-# Start the Task Scheduler
-scheduler = TaskScheduler(DATABASE_FILE)
-execution_thread = threading.Thread(target=scheduler.task_execution_loop, daemon=True)
-execution_thread.start()
 
-# Start the server
 PORT = 8000
-with socketserver.TCPServer(("", PORT), MyHandler) as httpd:
-    print(f"Serving at port {PORT}")
-    system_logger.debug(f"Serving at port {PORT}")
-    httpd.serve_forever()
+parser = argparse.ArgumentParser(description="TaskBot scheduler and task API")
+parser.add_argument("--worker", action="store_true",
+                    help="only execute due tasks, without the HTTP API (run several against one database)")
+parser.add_argument("--port", type=int, default=PORT, help="port of the HTTP API")
+parser.add_argument("--database", default=DATABASE_FILE, help="SQLite task database shared by all processes")
+parser.add_argument("--shards", type=int, default=TASK_SHARDS,
+                    help="number of database files the tasks are spread over (change it with reshard.py)")
+parser.add_argument("--log-level", default=CONSOLE_LOG_LEVEL, choices=("DEBUG", "INFO", "WARNING", "ERROR", "OFF"),
+                    help="level of the console output (OFF to silence it)")
+args = parser.parse_args()
+console_handler.setLevel(logging.CRITICAL + 1 if args.log_level == "OFF" else args.log_level)
+
+if args.shards < 1:
+    parser.error("--shards must be at least 1")
+if args.shards > 1 and os.path.exists(args.database):
+    parser.error(f"{args.database} holds an unsharded store; move it to {args.shards} shards with reshard.py")
+if args.shards == 1 and os.path.exists(shard_paths(args.database, 2)[0]):
+    parser.error(f"{args.database} is sharded; start with --shards set to its number of shards")
+response_cache = ResponseCache(max_entries=RESPONSE_CACHE_ENTRIES, max_body_bytes=RESPONSE_CACHE_MAX_BODY,
+                               max_total_bytes=RESPONSE_CACHE_MAX_BYTES)
+
+# Initialize every shard, load its tasks into memory and start its Task Scheduler. The worker
+# threads are divided between the shards; the outbound connections and the rate limits and
+# circuits of the destinations are shared
+shards = []
+http_pool = destination_guard = None
+for index, path in enumerate(shard_paths(args.database, args.shards)):
+    shard_db = SQLitePool(path, synchronous=DB_SYNCHRONOUS, cache_size=DB_CACHE_SIZE,
+                          mmap_size=DB_MMAP_SIZE, busy_timeout=DB_BUSY_TIMEOUT)
+    try:
+        init_db(shard_db, index, args.shards)
+    except ValueError as e:
+        parser.error(f"{path}: {e}")
+    registry = TaskRegistry(shard_db, sync_interval=REGISTRY_SYNC_INTERVAL, tombstone_ttl=TOMBSTONE_TTL)
+    registry.load()
+    scheduler = TaskScheduler(shard_db, max_workers=max(MAX_WORKERS // args.shards, 1),
+                              max_per_destination=max(MAX_PER_DESTINATION // args.shards, 1),
+                              http_pool=http_pool, guard=destination_guard, registry=registry)
+    http_pool, destination_guard = scheduler.http_pool, scheduler.guard
+    shards.append(TaskShard(index, shard_db, registry, scheduler))
+    threading.Thread(target=scheduler.task_execution_loop, name=f"Scheduler-{index}", daemon=True).start()
+
+# Connections handled at once and accept backlog of the API server
+SERVER_WORKERS = 16
+SERVER_BACKLOG = 128
+if args.worker:
+    system_logger.info(f"Worker {shards[0].scheduler.worker_id} running {len(shards)} shard(s) without the HTTP API")
+    wait_for_signal()
+else:
+    # Start the server
+    httpd = PooledHTTPServer(("", args.port), MyHandler, max_workers=SERVER_WORKERS, backlog=SERVER_BACKLOG)
+    system_logger.info(f"Serving at port {args.port}")
+    serve(httpd)
+for shard in shards:
+    shard.scheduler.stop()
+    shard.db.close()
+system_logger.debug("SERVER STOPPED")
+log_listener.stop()
@@ -0,0 +1,184 @@
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+
+# Default histogram buckets in seconds
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+
+def format_labels(label_names, label_values, extra=()):
+    pairs = list(zip(label_names, label_values)) + list(extra)
+    if not pairs:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"') for _, value in pairs)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + "}"
+
+
+def format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric:
+    """Base class of metrics; values are kept per tuple of label values."""
+
+    type = None
+
+    def __init__(self, name, documentation, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(labels)
+        self.values = {}
+        self.lock = threading.Lock()
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type}"]
+        with self.lock:
+            items = sorted(self.values.items())
+        for label_values, value in items:
+            lines.extend(self.render_value(label_values, value))
+        return lines
+
+    def render_value(self, label_values, value):
+        return [f"{self.name}{format_labels(self.label_names, label_values)} {format_value(value)}"]
+
+
+class Counter(Metric):
+    """Monotonically increasing count."""
+
+    type = "counter"
+
+    def inc(self, *label_values, amount=1):
+        with self.lock:
+            self.values[label_values] = self.values.get(label_values, 0) + amount
+
+
+class Gauge(Metric):
+    """Value that can go up and down, or is read from callbacks when rendered."""
+
+    type = "gauge"
+
+    def __init__(self, name, documentation, labels=(), callback=None):
+        """callback, if given, returns {label_values: value} and is called on every render."""
+        super().__init__(name, documentation, labels)
+        self.callbacks = {}
+        if callback is not None:
+            self.add_callback(callback)
+
+    def add_callback(self, callback, owner=None):
+        """
+        Add a callback whose values are summed with those of the other callbacks, e.g. one per
+        scheduler of a sharded store. A callback added again for the same owner replaces the
+        previous one, so an object shared by several components is only counted once.
+        """
+        with self.lock:
+            self.callbacks[callback if owner is None else owner] = callback
+
+    def set(self, value, *label_values):
+        with self.lock:
+            self.values[label_values] = value
+
+    def render(self):
+        with self.lock:
+            callbacks = list(self.callbacks.values())
+        if callbacks:
+            values = {}
+            for callback in callbacks:
+                for label_values, value in dict(callback()).items():
+                    values[label_values] = values.get(label_values, 0) + value
+            with self.lock:
+                self.values = values
+        return super().render()
+
+
+class Histogram(Metric):
+    """Distribution of observed values over fixed buckets."""
+
+    type = "histogram"
+
+    def __init__(self, name, documentation, labels=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, *label_values):
+        index = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            state = self.values.get(label_values)
+            if state is None:
+                # Per-bucket counts (the last one is +Inf), sum, count
+                state = [[0] * (len(self.buckets) + 1), 0.0, 0]
+                self.values[label_values] = state
+            state[0][index] += 1
+            state[1] += value
+            state[2] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type}"]
+        with self.lock:
+            items = sorted((label_values, ([*state[0]], state[1], state[2])) for label_values, state in self.values.items())
+        for label_values, (counts, total, count) in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                labels = format_labels(self.label_names, label_values, [("le", format_value(bound))])
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = format_labels(self.label_names, label_values)
+            lines.append(f"{self.name}_sum{labels} {format_value(total)}")
+            lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+
+@contextmanager
+def timed(histogram, *label_values):
+    """Observe the time spent in the with block on a histogram."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        histogram.observe(time.perf_counter() - start, *label_values)
+
+
+class Registry:
+    """Collection of metrics rendered together in the Prometheus text format."""
+
+    def __init__(self):
+        self.metrics = {}
+        self.lock = threading.Lock()
+
+    def register(self, metric):
+        # Registering a name twice returns the existing metric
+        with self.lock:
+            return self.metrics.setdefault(metric.name, metric)
+
+    def counter(self, name, documentation, labels=()):
+        return self.register(Counter(name, documentation, labels))
+
+    def gauge(self, name, documentation, labels=(), callback=None, owner=None):
+        # A gauge registered again gets the new callback added (see Gauge.add_callback)
+        gauge = self.register(Gauge(name, documentation, labels))
+        if callback is not None:
+            gauge.add_callback(callback, owner)
+        return gauge
+
+    def histogram(self, name, documentation, labels=(), buckets=LATENCY_BUCKETS):
+        return self.register(Histogram(name, documentation, labels, buckets))
+
+    def render(self):
+        with self.lock:
+            metrics = list(self.metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+# Process-wide registry served by GET /metrics
+REGISTRY = Registry()
+
+# Shared metrics of the HTTP servers and the database layer
+API_REQUEST_DURATION = REGISTRY.histogram(
+    "api_request_duration_seconds", "Time to handle an API request", ("method",))
+DB_OPERATION_DURATION = REGISTRY.histogram(
+    "db_operation_duration_seconds", "Time spent in a database operation", ("operation",))
@@ -0,0 +1,175 @@
+import http.server
+import json
+import signal
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from metrics import REGISTRY, API_REQUEST_DURATION
+
+
+class PooledHTTPServer(http.server.HTTPServer):
+    """HTTP server that handles connections on a bounded pool of worker threads."""
+
+    allow_reuse_address = True
+
+    def __init__(self, server_address, handler_class, max_workers=16, backlog=128, drain_timeout=10):
+        """
+        Args:
+            server_address (tuple): Host and port to listen on.
+            handler_class (type): Request handler class.
+            max_workers (int): Maximum number of connections handled at once.
+            backlog (int): Accept backlog passed to listen().
+            drain_timeout (float): Seconds to wait for open connections on shutdown.
+        """
+        self.request_queue_size = backlog
+        self.drain_timeout = drain_timeout
+        self.draining = False
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="HTTPWorker")
+        super().__init__(server_address, handler_class)
+
+    def process_request(self, request, client_address):
+        """Hand the connection to the worker pool instead of handling it inline."""
+        self.executor.submit(self.process_request_thread, request, client_address)
+
+    def process_request_thread(self, request, client_address):
+        """Worker entry point: handle all requests of a connection, then close it."""
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+
+    def drain(self):
+        """Stop accepting connections and wait for open ones to finish."""
+        self.draining = True
+        done = threading.Event()
+
+        def wait_for_workers():
+            self.executor.shutdown(wait=True)
+            done.set()
+
+        threading.Thread(target=wait_for_workers, daemon=True).start()
+        return done.wait(self.drain_timeout)
+
+
+class PooledRequestHandler(http.server.SimpleHTTPRequestHandler):
+    """Request handler that keeps HTTP/1.1 connections open between requests."""
+
+    protocol_version = "HTTP/1.1"
+    # Headers and body are written separately; without TCP_NODELAY the body of a
+    # kept-alive connection waits for the client's delayed ACK
+    disable_nagle_algorithm = True
+    # Seconds an idle keep-alive connection may hold a worker thread
+    timeout = 5
+    # Request bodies a handler did not read are skipped up to this size to keep the
+    # connection open; after larger ones the connection is closed
+    max_discard_bytes = 1024 * 1024
+
+    def parse_request(self):
+        # Called once the request line is read, so idle keep-alive time is not measured
+        self.request_start = time.perf_counter()
+        self.body_read = False
+        return super().parse_request()
+
+    def handle_one_request(self):
+        self.request_start = None
+        super().handle_one_request()
+        if self.request_start is not None and self.command:
+            API_REQUEST_DURATION.observe(time.perf_counter() - self.request_start, self.command)
+            if not self.body_read and not self.close_connection:
+                self.discard_body()
+        if self.server.draining:
+            self.close_connection = True
+
+    def read_body(self):
+        """Read the request body of Content-Length bytes."""
+        self.body_read = True
+        return self.rfile.read(int(self.headers.get("Content-Length", 0)))
+
+    def discard_body(self):
+        """
+        Skip the body of a request whose handler answered without reading it, so the body
+        is not parsed as the next request of the connection.
+        """
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+            if length > self.max_discard_bytes:
+                self.close_connection = True
+                return
+            while length > 0:
+                chunk = self.rfile.read(min(length, 64 * 1024))
+                if not chunk:
+                    self.close_connection = True
+                    return
+                length -= len(chunk)
+        except (ValueError, OSError):
+            self.close_connection = True
+
+    def send_metrics(self):
+        """Send all metrics of this process in the Prometheus text format."""
+        body = REGISTRY.render().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_chunked(self, status_code, chunks, content_type="application/json", headers=None):
+        """
+        Stream an iterable of bytes as the response body without buffering it.
+        Uses chunked transfer encoding, or closes the connection for HTTP/1.0 clients.
+        """
+        chunked = self.request_version != "HTTP/1.0"
+        self.send_response(status_code)
+        self.send_header("Content-Type", content_type)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        if chunked:
+            self.send_header("Transfer-Encoding", "chunked")
+        else:
+            self.send_header("Connection", "close")
+            self.close_connection = True
+        self.end_headers()
+        for chunk in chunks:
+            if not chunk:
+                continue
+            if chunked:
+                self.wfile.write(b"%X\r\n%s\r\n" % (len(chunk), chunk))
+            else:
+                self.wfile.write(chunk)
+        if chunked:
+            self.wfile.write(b"0\r\n\r\n")
+
+
+def json_array_chunks(items, chunk_size=64 * 1024):
+    """Serialize an iterable of JSON-compatible objects as a JSON array, yielding chunks of about chunk_size bytes."""
+    buffer = [b"["]
+    size = 1
+    separator = b""
+    for item in items:
+        encoded = separator + json.dumps(item).encode()
+        separator = b", "
+        buffer.append(encoded)
+        size += len(encoded)
+        if size >= chunk_size:
+            yield b"".join(buffer)
+            buffer = []
+            size = 0
+    buffer.append(b"]")
+    yield b"".join(buffer)
+
+
+def serve(server):
+    """Serve until SIGINT or SIGTERM, then drain open connections and close the server."""
+    def request_shutdown(signum, frame):
+        # shutdown() blocks until serve_forever() returns, so it cannot run in this thread
+        threading.Thread(target=server.shutdown, daemon=True).start()
+
+    signal.signal(signal.SIGINT, request_shutdown)
+    signal.signal(signal.SIGTERM, request_shutdown)
+    try:
+        server.serve_forever()
+    finally:
+        server.drain()
+        server.server_close()
@@ -0,0 +1,159 @@
+"""
+Offline tool that moves a TaskBot task store into a new shard layout.
+
+Stop every main.py process using the store first. The tasks and their execution
+history are copied into new shard files, where each task lands on the shard of its
+name and gets a new id in that shard's id range; leases are dropped. The old files
+are kept with a .bak suffix. Start main.py with the new --shards value afterwards, e.g.
+    python reshard.py --database tasks.db --from-shards 1 --to-shards 4
+    python main.py --shards 4
+"""
+import argparse
+import os
+import sqlite3
+import sys
+from retention import enable_incremental_vacuum
+from sharding import shard_paths, shard_of, init_shard_layout
+
+# Rows read from a source database at a time
+COPY_BATCH_SIZE = 1000
+# Columns of the tasks table that are not copied: ids are assigned by the target shard,
+# row_version by its triggers, and leases do not survive the move
+SKIPPED_COLUMNS = ("id", "row_version", "lease_owner", "lease_expires")
+
+
+def layout_of(conn):
+    """(shard, shard_count) recorded in a database, None if it predates sharding."""
+    if not conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'shard_layout'").fetchone():
+        return None
+    return conn.execute("SELECT shard, shard_count FROM shard_layout WHERE id = 0").fetchone()
+
+
+def create_target(path, source, index, count, version):
+    """Create an empty shard with the schema of source, starting its data version at version."""
+    conn = sqlite3.connect(path)
+    enable_incremental_vacuum(conn)
+    schema = source.execute("""
+    SELECT sql FROM sqlite_master
+    WHERE sql IS NOT NULL AND name NOT LIKE 'sqlite_%' AND name != 'shard_layout'
+    ORDER BY rowid
+    """).fetchall()
+    cursor = conn.cursor()
+    for sql, in schema:
+        cursor.execute(sql)
+    init_shard_layout(cursor, index, count)
+    cursor.execute("INSERT OR REPLACE INTO task_version (id, version) VALUES (0, ?)", (version,))
+    conn.commit()
+    return conn
+
+
+def copy_source(source, targets, count):
+    """
+    Copy the tasks of one source database to their target shards, then their executions
+    with the task ids translated. Returns the number of tasks and executions copied.
+    """
+    columns = [row[1] for row in source.execute("PRAGMA table_info(tasks)") if row[1] not in SKIPPED_COLUMNS]
+    insert = f"INSERT INTO tasks ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})"
+    name_index = columns.index("name")
+    new_ids = {}
+    reader = source.execute(f"SELECT id, {', '.join(columns)} FROM tasks ORDER BY id")
+    while True:
+        rows = reader.fetchmany(COPY_BATCH_SIZE)
+        if not rows:
+            break
+        for task_id, *values in rows:
+            shard = shard_of(values[name_index], count)
+            new_ids[task_id] = (shard, targets[shard].execute(insert, values).lastrowid)
+
+    execution_columns = [row[1] for row in source.execute("PRAGMA table_info(executions)")
+                         if row[1] not in ("id", "task_id")]
+    insert = (f"INSERT INTO executions (task_id, {', '.join(execution_columns)}) "
+              f"VALUES ({', '.join('?' * (len(execution_columns) + 1))})")
+    copied = 0
+    reader = source.execute(f"SELECT task_id, {', '.join(execution_columns)} FROM executions ORDER BY id")
+    while True:
+        rows = reader.fetchmany(COPY_BATCH_SIZE)
+        if not rows:
+            break
+        by_shard = {}
+        for task_id, *values in rows:
+            # Executions of tasks that no longer exist are dropped
+            if task_id in new_ids:
+                shard, new_id = new_ids[task_id]
+                by_shard.setdefault(shard, []).append((new_id, *values))
+        for shard, batch in by_shard.items():
+            targets[shard].executemany(insert, batch)
+            copied += len(batch)
+    return len(new_ids), copied
+
+
+def reshard(database, from_shards, to_shards):
+    sources = shard_paths(database, from_shards)
+    targets = shard_paths(database, to_shards)
+    for path in sources:
+        if not os.path.exists(path):
+            raise SystemExit(f"{path} does not exist; is the store in {from_shards} shard(s)?")
+        if os.path.exists(path + ".bak"):
+            raise SystemExit(f"{path}.bak exists; move the previous backup away first")
+    for path in targets:
+        if os.path.exists(path) and path not in sources:
+            raise SystemExit(f"{path} exists but is not part of the current layout")
+
+    source_conns = []
+    for index, path in enumerate(sources):
+        conn = sqlite3.connect(path)
+        layout = layout_of(conn)
+        if layout is not None and tuple(layout) != (index, from_shards):
+            raise SystemExit(f"{path} is shard {layout[0]} of {layout[1]}, not shard {index} of {from_shards}")
+        source_conns.append(conn)
+    # The new data versions start above the old ones, so ETags handed out before stay invalid
+    version = sum(conn.execute("SELECT version FROM task_version WHERE id = 0").fetchone()[0]
+                  for conn in source_conns) + 1
+
+    temporary = [path + ".reshard" for path in targets]
+    for path in temporary:
+        for suffix in ("", "-wal", "-shm"):
+            if os.path.exists(path + suffix):
+                os.remove(path + suffix)
+    target_conns = [create_target(path, source_conns[0], index, to_shards, version)
+                    for index, path in enumerate(temporary)]
+    tasks = executions = 0
+    for index, conn in enumerate(source_conns):
+        copied_tasks, copied_executions = copy_source(conn, target_conns, to_shards)
+        print(f"{sources[index]}: {copied_tasks} tasks, {copied_executions} executions")
+        tasks += copied_tasks
+        executions += copied_executions
+    counts = []
+    for conn in target_conns:
+        conn.commit()
+        counts.append(conn.execute("SELECT COUNT(*) FROM tasks").fetchone()[0])
+        conn.close()
+    for conn in source_conns:
+        conn.close()
+    if sum(counts) != tasks:
+        raise SystemExit(f"Copied {sum(counts)} tasks instead of {tasks}; the old files were left in place")
+
+    for path in sources:
+        os.replace(path, path + ".bak")
+    for path, final in zip(temporary, targets):
+        os.replace(path, final)
+    for final, count in zip(targets, counts):
+        print(f"{final}: {count} tasks")
+    print(f"Moved {tasks} tasks and {executions} executions from {from_shards} to {to_shards} shard(s)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Move a TaskBot task store into a new shard layout (offline)")
+    parser.add_argument("--database", default="tasks.db", help="task database as passed to main.py --database")
+    parser.add_argument("--from-shards", type=int, default=1, help="current number of shards")
+    parser.add_argument("--to-shards", type=int, required=True, help="new number of shards")
+    options = parser.parse_args()
+    if options.from_shards < 1 or options.to_shards < 1:
+        parser.error("shard counts must be at least 1")
+    if options.from_shards == options.to_shards:
+        parser.error("the store already has that many shards")
+    reshard(options.database, options.from_shards, options.to_shards)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
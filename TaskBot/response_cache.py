@@ -0,0 +1,64 @@
+import threading
+from collections import OrderedDict
+from metrics import REGISTRY
+
+CACHE_REQUESTS = REGISTRY.counter("api_response_cache_total", "Cacheable API reads by outcome", ("result",))
+
+
+def etag(version):
+    """Strong ETag of a response generated at the given data version."""
+    return f'"v{version}"'
+
+
+def etag_matches(if_none_match, current):
+    """Whether an If-None-Match header value matches the current ETag."""
+    if not if_none_match:
+        return False
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate == "*" or candidate == current:
+            return True
+    return False
+
+
+class ResponseCache:
+    """
+    Serialized responses by request path, valid for one data version.
+    An entry is only returned for the version it was stored with, so any mutation
+    invalidates all entries at once. At most max_entries responses of up to
+    max_body_bytes each and max_total_bytes together are kept; the least recently
+    used one is dropped first.
+    """
+
+    def __init__(self, max_entries=256, max_body_bytes=4 * 1024 * 1024, max_total_bytes=32 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.max_body_bytes = min(max_body_bytes, max_total_bytes)
+        self.max_total_bytes = max_total_bytes
+        self.entries = OrderedDict()
+        self.size = 0
+        self.lock = threading.Lock()
+
+    def get(self, key, version):
+        """Return the cached (status, headers, body) of key if it was stored at version, else None."""
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None or entry[0] != version:
+                return None
+            self.entries.move_to_end(key)
+            return entry[1]
+
+    def put(self, key, version, response):
+        """Store a (status, headers, body) response of key generated at version."""
+        if len(response[2]) > self.max_body_bytes:
+            return
+        with self.lock:
+            previous = self.entries.pop(key, None)
+            if previous is not None:
+                self.size -= len(previous[1][2])
+            self.entries[key] = (version, response)
+            self.size += len(response[2])
+            while len(self.entries) > self.max_entries or self.size > self.max_total_bytes:
+                _, (_, dropped) = self.entries.popitem(last=False)
+                self.size -= len(dropped[2])
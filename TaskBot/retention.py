@@ -0,0 +1,175 @@
+import argparse
+import logging
+import os
+import sqlite3
+import sys
+import threading
+import time
+from metrics import REGISTRY, DB_OPERATION_DURATION, timed
+
+logger = logging.getLogger("SystemLogger")
+
+ROWS_PURGED = REGISTRY.counter("retention_purged_rows_total", "Rows deleted by retention jobs", ("table",))
+
+
+def enable_incremental_vacuum(conn, rebuild=False):
+    """
+    Switch a database to auto_vacuum = INCREMENTAL so a RetentionJob can return freed pages
+    to the file system in small steps. A new database is switched directly. One with tables
+    has to be rebuilt with VACUUM, which locks it for the duration and needs free disk space
+    of about its size; that is only done with rebuild set (see main() for the offline step),
+    otherwise freed pages stay in the file for reuse. Must be called outside a transaction.
+    Returns True if the mode changed.
+    """
+    if conn.execute("PRAGMA auto_vacuum").fetchone()[0] == 2:
+        return False
+    conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+    if conn.execute("PRAGMA auto_vacuum").fetchone()[0] == 2:
+        return True
+    # A database without tables (e.g. new in WAL mode) is rebuilt at no cost
+    if not rebuild and conn.execute("SELECT 1 FROM sqlite_master LIMIT 1").fetchone() is not None:
+        logger.debug("Incremental vacuum is off for this database; "
+                     "run retention.py on it while it is not in use to enable it")
+        return False
+    logger.info("Rebuilding the database with VACUUM to enable incremental vacuum")
+    conn.execute("VACUUM")
+    return True
+
+
+class RetentionJob:
+    """
+    Background job that keeps a table within an age and/or row limit.
+    Rows are deleted oldest first in batches of batch_size, each in its own short transaction
+    with a pause in between, so foreground writers only ever wait for one small batch.
+    Afterwards the freed pages are released with PRAGMA incremental_vacuum, also in steps.
+    """
+
+    def __init__(self, db, table, order_column, max_age=None, max_rows=None, cutoff_value=None,
+                 interval=600, batch_size=1000, pause=0.05, vacuum_pages=1000):
+        """
+        Args:
+            db (SQLitePool): Connection pool of the database holding the table.
+            table (str): Table to purge; it needs an index on order_column.
+            order_column (str): Column giving the age of a row; ties are broken by id.
+            max_age (float): Rows older than this many seconds are deleted (None = no age limit).
+            max_rows (int): The newest max_rows rows are kept (None = no row limit).
+            cutoff_value (callable): Converts the cutoff as epoch seconds to a value of order_column.
+            interval (float): Seconds between runs.
+            batch_size (int): Rows deleted per transaction.
+            pause (float): Seconds to wait between two batches.
+            vacuum_pages (int): Pages released per incremental_vacuum step.
+        """
+        self.db = db
+        self.table = table
+        self.order_column = order_column
+        self.max_age = max_age
+        self.max_rows = max_rows
+        self.cutoff_value = cutoff_value or (lambda cutoff: cutoff)
+        self.interval = interval
+        self.batch_size = batch_size
+        self.pause = pause
+        self.vacuum_pages = vacuum_pages
+        self.stopped = threading.Event()
+        self.thread = None
+
+    def start(self):
+        if self.max_age is None and self.max_rows is None:
+            return
+        self.thread = threading.Thread(target=self.run, name=f"Retention-{self.table}", daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.stopped.set()
+        if self.thread is not None:
+            self.thread.join()
+
+    def run(self):
+        # Apply the limits right away and then every interval seconds.
+        while not self.stopped.is_set():
+            try:
+                deleted = self.purge()
+                if deleted:
+                    logger.info(f"Retention deleted {deleted} rows from {self.table}")
+                    self.vacuum()
+            except Exception as e:
+                logger.error(f"Retention of {self.table} failed: {e}")
+            self.stopped.wait(self.interval)
+
+    def purge(self):
+        """Delete the rows over the age and row limits. Returns the number deleted."""
+        deleted = 0
+        if self.max_age is not None:
+            cutoff = self.cutoff_value(time.time() - self.max_age)
+            deleted += self.delete_batches(f"WHERE {self.order_column} < ?", (cutoff,))
+        if self.max_rows is not None:
+            with self.db.connect() as conn:
+                count = conn.execute(f"SELECT COUNT(*) FROM {self.table}").fetchone()[0]
+            if count > self.max_rows:
+                deleted += self.delete_batches("", (), count - self.max_rows)
+        return deleted
+
+    def delete_batches(self, where, params, limit=None):
+        # Delete the oldest matching rows, at most limit of them, one batch per transaction.
+        deleted = 0
+        while not self.stopped.is_set() and (limit is None or deleted < limit):
+            size = self.batch_size if limit is None else min(self.batch_size, limit - deleted)
+            with timed(DB_OPERATION_DURATION, f"purge_{self.table}"), self.db.connect() as conn:
+                cursor = conn.execute(f"""
+                DELETE FROM {self.table} WHERE id IN (
+                    SELECT id FROM {self.table} {where} ORDER BY {self.order_column}, id LIMIT ?
+                )
+                """, (*params, size))
+            deleted += cursor.rowcount
+            ROWS_PURGED.inc(self.table, amount=cursor.rowcount)
+            if cursor.rowcount < size:
+                break
+            self.stopped.wait(self.pause)
+        return deleted
+
+    def vacuum(self):
+        """Release free pages to the file system, vacuum_pages at a time."""
+        conn = self.db.connect()
+        if conn.execute("PRAGMA auto_vacuum").fetchone()[0] != 2:
+            return
+        free_pages = conn.execute("PRAGMA freelist_count").fetchone()[0]
+        while free_pages and not self.stopped.is_set():
+            with timed(DB_OPERATION_DURATION, "incremental_vacuum"):
+                # The pragma frees one page per step; execute() would only step it once,
+                # executescript() runs it to completion
+                conn.executescript(f"PRAGMA incremental_vacuum({int(self.vacuum_pages)});")
+            remaining = conn.execute("PRAGMA freelist_count").fetchone()[0]
+            if remaining >= free_pages:
+                break
+            free_pages = remaining
+            self.stopped.wait(self.pause)
+
+
+def main():
+    # Offline step: rebuild existing databases with incremental vacuum enabled.
+    parser = argparse.ArgumentParser(
+        description="Rebuild TaskBot databases with incremental vacuum, so retention returns freed space to the "
+                    "file system. Stop the servers using them first; each rebuild needs free disk space of about "
+                    "the database's size.")
+    parser.add_argument("databases", nargs="+", help="database files, e.g. tasks.db items.db")
+    options = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    for path in options.databases:
+        if not os.path.exists(path):
+            parser.error(f"{path} does not exist")
+    for path in options.databases:
+        size = os.path.getsize(path)
+        started = time.monotonic()
+        conn = sqlite3.connect(path, isolation_level=None)
+        try:
+            changed = enable_incremental_vacuum(conn, rebuild=True)
+        finally:
+            conn.close()
+        if changed:
+            print(f"{path}: rebuilt in {time.monotonic() - started:.1f}s, "
+                  f"{size // 1024} KiB -> {os.path.getsize(path) // 1024} KiB")
+        else:
+            print(f"{path}: incremental vacuum already enabled")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
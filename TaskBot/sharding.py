@@ -0,0 +1,44 @@
+import os
+import zlib
+
+# Task ids of shard n start above n << SHARD_ID_BITS, so ids are unique across shards
+# and ordering by id lists shard after shard
+SHARD_ID_BITS = 40
+
+
+def shard_paths(database, count):
+    """Database files of a layout with count shards: the file itself, or tasks.shard<n>.db for tasks.db."""
+    if count == 1:
+        return [database]
+    root, extension = os.path.splitext(database)
+    return [f"{root}.shard{index}{extension}" for index in range(count)]
+
+
+def shard_of(name, count):
+    """Shard of a task name; stable across processes and restarts, unlike hash()."""
+    return zlib.crc32(name.encode("utf-8")) % count
+
+
+def init_shard_layout(cursor, index, count):
+    """
+    Record which shard of which layout a task database is, and start its task ids at the
+    shard's range. Raises ValueError if the database belongs to another layout.
+    Must run after the tasks table is created.
+    """
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS shard_layout (
+        id INTEGER PRIMARY KEY CHECK (id = 0),
+        shard INTEGER NOT NULL,
+        shard_count INTEGER NOT NULL
+    )
+    """)
+    cursor.execute("INSERT OR IGNORE INTO shard_layout (id, shard, shard_count) VALUES (0, ?, ?)", (index, count))
+    shard, shard_count = cursor.execute("SELECT shard, shard_count FROM shard_layout WHERE id = 0").fetchone()
+    if (shard, shard_count) != (index, count):
+        raise ValueError(f"Database is shard {shard} of {shard_count}, not shard {index} of {count}; "
+                         f"move the tasks with reshard.py first")
+    # AUTOINCREMENT continues after the highest of this sequence and the existing ids
+    cursor.execute("""
+    INSERT INTO sqlite_sequence (name, seq)
+    SELECT 'tasks', ? WHERE NOT EXISTS (SELECT 1 FROM sqlite_sequence WHERE name = 'tasks')
+    """, (index << SHARD_ID_BITS,))
@@ -0,0 +1,92 @@
+import hashlib
+import logging
+import os
+import re
+from collections import OrderedDict
+
+# Characters task log file names keep; see log_file_name()
+UNSAFE_FILE_CHARACTERS = re.compile(r"[^A-Za-z0-9 ._-]")
+# Longest part of a task name used in its log file name
+MAX_FILE_NAME_LENGTH = 100
+
+
+def log_file_name(task_name):
+    """
+    Log file name of a task. A name of only letters, digits, spaces, dots, dashes and
+    underscores is used as it is; any other name has the other characters replaced and a
+    hash of the full name appended, so it cannot leave the log directory or share a file.
+    """
+    safe = UNSAFE_FILE_CHARACTERS.sub("_", task_name)[:MAX_FILE_NAME_LENGTH]
+    if safe == task_name and not task_name.startswith("."):
+        return f"{task_name}.log"
+    digest = hashlib.sha1(task_name.encode("utf-8", "surrogatepass")).hexdigest()[:12]
+    return f"{safe.lstrip('.')}-{digest}.log"
+
+
+class TaskLogRouter(logging.Handler):
+    """
+    Writes task log records to <directory>/<task_name>.log (see log_file_name()).
+    At most max_open files are kept open; the least recently used one is closed
+    when another task logs, and reopened in append mode when that task logs again.
+    Meant to run on a single QueueListener thread.
+    """
+
+    def __init__(self, directory="logs", max_open=128, formatter=None):
+        super().__init__()
+        self.directory = directory
+        self.max_open = max_open
+        self.files = OrderedDict()
+        if formatter is not None:
+            self.setFormatter(formatter)
+        os.makedirs(directory, exist_ok=True)
+
+    def emit(self, record):
+        # An error must not escape: it would end the QueueListener thread and with it all logging
+        try:
+            self.route(record)
+        except Exception:
+            self.handleError(record)
+
+    def route(self, record):
+        task_name = record.task_name
+        if getattr(record, "drop_task_log", False):
+            handler = self.files.pop(task_name, None)
+            if handler is not None:
+                handler.close()
+            return
+        handler = self.files.get(task_name)
+        if handler is None:
+            if len(self.files) >= self.max_open:
+                _, oldest = self.files.popitem(last=False)
+                oldest.close()
+            handler = logging.FileHandler(os.path.join(self.directory, log_file_name(task_name)))
+            handler.setFormatter(self.formatter)
+            self.files[task_name] = handler
+        else:
+            self.files.move_to_end(task_name)
+        handler.emit(record)
+
+    def close(self):
+        for handler in self.files.values():
+            handler.close()
+        self.files.clear()
+        super().close()
+
+
+def is_task_record(record):
+    """Filter for records logged through a task logger."""
+    return hasattr(record, "task_name")
+
+
+def is_system_record(record):
+    """Filter for records that do not belong to a task."""
+    return not hasattr(record, "task_name")
+
+
+def drop_record(task_name):
+    """
+    Record telling the TaskLogRouter to close the log file of a deleted task. It carries the
+    highest level so no handler level filters it out before it reaches the router.
+    """
+    return logging.makeLogRecord({"task_name": task_name, "drop_task_log": True,
+                                  "levelno": logging.CRITICAL, "levelname": "CRITICAL"})
@@ -0,0 +1,206 @@
+import bisect
+import logging
+import threading
+import time
+from metrics import DB_OPERATION_DURATION, timed
+
+logger = logging.getLogger("SystemLogger")
+
+
+class TaskRecord:
+    """One task as held in memory. Records are never changed in place; a change replaces the record."""
+
+    __slots__ = ("id", "name", "operation", "type", "interval", "cron", "next_execution", "destination", "payload",
+                 "misfire_policy", "jitter", "rate_limit", "retry_policy", "status", "attempts", "last_error",
+                 "next_execution_ts", "destination_host")
+
+    def __init__(self, *values):
+        for column, value in zip(self.__slots__, values):
+            setattr(self, column, value)
+
+    def row(self, fields):
+        """Values of the given fields as a tuple."""
+        return tuple(getattr(self, field) for field in fields)
+
+    def replace(self, **changes):
+        """Copy of the record with some columns changed."""
+        record = TaskRecord(*self.row(self.__slots__))
+        for column, value in changes.items():
+            setattr(record, column, value)
+        return record
+
+
+class TaskRegistry:
+    """
+    In-memory copy of the tasks table, indexed by id, name and destination host.
+
+    Loaded once, then kept current in two ways: writes of this process are applied
+    write-through, and sync() pulls the rows changed since the last sync, including those of
+    other processes. For that the tasks table stamps every changed row with the data version
+    (row_version) and deleted tasks leave a tombstone in task_tombstones for tombstone_ttl seconds.
+    The registry's version is the data version it has caught up with, usable as an ETag.
+    """
+
+    def __init__(self, db, sync_interval=0.1, tombstone_ttl=3600):
+        """
+        Args:
+            db (SQLitePool): Connection pool of the task database.
+            sync_interval (float): Reads check the database for changes at most this often (seconds).
+            tombstone_ttl (float): Seconds tombstones are kept; a registry that has not synced for
+                half of it reloads the whole table instead.
+        """
+        self.db = db
+        self.sync_interval = sync_interval
+        self.tombstone_ttl = tombstone_ttl
+        self.version = None
+        self.by_id = {}
+        self.by_name = {}
+        self.by_host = {}
+        self.ids = []
+        self.checked_at = 0
+        self.synced_at = 0
+        self.lock = threading.Lock()
+
+    def load(self):
+        """Read the whole tasks table."""
+        with self.lock:
+            version, rows, _ = self.read_changes(None)
+            self.by_id, self.by_name, self.by_host, self.ids = {}, {}, {}, []
+            for row in rows:
+                self.put(TaskRecord(*row))
+            self.version = version
+            self.checked_at = self.synced_at = time.monotonic()
+        logger.debug(f"Task registry loaded {len(rows)} tasks at version {version}")
+
+    def sync(self, force=False):
+        """
+        Apply the changes made since the last sync. Unless force is set, the database is
+        checked at most every sync_interval seconds. Returns the version caught up with.
+        """
+        now = time.monotonic()
+        if not force and now - self.checked_at < self.sync_interval:
+            return self.version
+        if self.version is None or now - self.synced_at > self.tombstone_ttl / 2:
+            self.load()
+            return self.version
+        with self.lock:
+            self.checked_at = now
+            self.synced_at = now
+            version, rows, deleted = self.read_changes(self.version)
+            if version == self.version:
+                return version
+            for task_id in deleted:
+                self.remove(task_id)
+            for row in rows:
+                self.put(TaskRecord(*row))
+            self.version = version
+            return version
+
+    def read_changes(self, since):
+        # Data version, rows changed after version since (all rows if None) and ids deleted after it,
+        # read in one transaction so they belong to the same snapshot. Caller holds the lock.
+        conn = self.db.connect()
+        columns = ", ".join(TaskRecord.__slots__)
+        started = not conn.in_transaction
+        if started:
+            conn.execute("BEGIN")
+        try:
+            version = conn.execute("SELECT version FROM task_version WHERE id = 0").fetchone()[0]
+            if version == since:
+                return version, [], []
+            with timed(DB_OPERATION_DURATION, "registry_sync"):
+                if since is None:
+                    return version, conn.execute(f"SELECT {columns} FROM tasks ORDER BY id").fetchall(), []
+                rows = conn.execute(f"SELECT {columns} FROM tasks WHERE row_version > ?", (since,)).fetchall()
+                deleted = [task_id for task_id, in conn.execute(
+                    "SELECT task_id FROM task_tombstones WHERE version > ?", (since,))]
+                return version, rows, deleted
+        finally:
+            if started:
+                conn.commit()
+
+    def put(self, record):
+        # Insert or replace a record in all indexes. Caller holds the lock.
+        previous = self.by_id.get(record.id)
+        if previous is not None:
+            if previous.name != record.name:
+                self.by_name.pop(previous.name, None)
+            if previous.destination_host != record.destination_host:
+                self.by_host.get(previous.destination_host, set()).discard(record.id)
+        elif not self.ids or record.id > self.ids[-1]:
+            self.ids.append(record.id)
+        else:
+            bisect.insort(self.ids, record.id)
+        self.by_id[record.id] = record
+        self.by_name[record.name] = record
+        self.by_host.setdefault(record.destination_host, set()).add(record.id)
+
+    def remove(self, task_id):
+        # Drop a record from all indexes. Caller holds the lock.
+        record = self.by_id.pop(task_id, None)
+        if record is None:
+            return
+        if self.by_name.get(record.name) is record:
+            del self.by_name[record.name]
+        hosts = self.by_host.get(record.destination_host)
+        if hosts is not None:
+            hosts.discard(task_id)
+            if not hosts:
+                del self.by_host[record.destination_host]
+        index = bisect.bisect_left(self.ids, task_id)
+        if index < len(self.ids) and self.ids[index] == task_id:
+            del self.ids[index]
+
+    def update(self, task_id, **changes):
+        """Write-through of a change this process made to a task (not yet committed)."""
+        with self.lock:
+            record = self.by_id.get(task_id)
+            if record is not None:
+                self.put(record.replace(**changes))
+
+    def discard(self, task_id):
+        """Write-through of a task this process deleted (not yet committed)."""
+        with self.lock:
+            self.remove(task_id)
+
+    def get(self, name):
+        """Record of the task with this name, or None."""
+        return self.by_name.get(name)
+
+    def ids_by_name(self, names):
+        """Map the names of existing tasks to their ids."""
+        with self.lock:
+            return {name: self.by_name[name].id for name in names if name in self.by_name}
+
+    def select(self, after=None, task_type=None, status=None, host=None, next_from=None, next_to=None, limit=None):
+        """Records matching all given filters, ordered by id, at most limit of them."""
+        with self.lock:
+            if host is not None:
+                ids = sorted(self.by_host.get(host, ()))
+            else:
+                ids = self.ids
+            start = bisect.bisect_right(ids, after) if after is not None else 0
+            records = []
+            for index in range(start, len(ids)):
+                record = self.by_id[ids[index]]
+                if task_type is not None and record.type != task_type:
+                    continue
+                if status is not None and record.status != status:
+                    continue
+                if next_from is not None and (record.next_execution_ts is None or record.next_execution_ts < next_from):
+                    continue
+                if next_to is not None and (record.next_execution_ts is None or record.next_execution_ts > next_to):
+                    continue
+                records.append(record)
+                if limit is not None and len(records) >= limit:
+                    break
+            return records
+
+    def due_times(self):
+        """(id, next_execution_ts) of every task that has a next execution."""
+        with self.lock:
+            return [(record.id, record.next_execution_ts) for record in self.by_id.values()
+                    if record.next_execution_ts is not None]
+
+    def __len__(self):
+        return len(self.by_id)